@@ -6,15 +6,33 @@ import time
 import logging
 import base64
 import re
-from threading import local, Lock
+import io
+import hashlib
+import signal
+import argparse
+import sqlite3
+import socket
+import threading
+import asyncio
+import multiprocessing
+import queue
+import shutil
+import subprocess
+import tempfile
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Lock, RLock, Condition
+from urllib.parse import urljoin, urlsplit, urlunsplit
 
 import undetected_chromedriver as uc
+import urllib3
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from dotenv import load_dotenv
-from openai import OpenAI
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from openai import OpenAI, AsyncOpenAI
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, TimeoutException
 
 # -------------------------------
 # Setup logging and environment
@@ -28,80 +46,1425 @@ if not OPENAI_API_KEY:
 
 # Create an OpenAI client using the new SDK style.
 client = OpenAI(api_key=OPENAI_API_KEY)
+# Async client used by the asyncio pipeline (see run_async_pipeline).
+async_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
 
 # -------------------------------
-# Thread-local browser initialization
+# Browser initialization
 # -------------------------------
-thread_local = local()
-browser_init_lock = Lock()
+# undetected_chromedriver downloads and patches chromedriver on every launch
+# unless it is handed an already patched binary, and doing that from several
+# launches at once races on the same file. The patched binary is therefore
+# prepared once per Chrome major version and cached; launches then run in
+# parallel, bounded by browser_launch_slots.
+CHROMEDRIVER_CACHE = os.path.join(os.path.dirname(uc.Patcher.data_path), "crawl-chromedriver")
+browser_launch_slots = threading.BoundedSemaphore(4)
+_chromedriver_lock = Lock()
+_chromedriver_path = None
+
+def configure_browser_launches(concurrency: int):
+    """Allow up to `concurrency` Chrome launches at once."""
+    global browser_launch_slots
+    browser_launch_slots = threading.BoundedSemaphore(max(1, concurrency))
+
+def chrome_major_version() -> int:
+    """Major version of the installed Chrome, or 0 (let uc pick) if it cannot be determined."""
+    try:
+        output = subprocess.run([uc.find_chrome_executable(), "--version"], capture_output=True,
+                                text=True, timeout=10).stdout
+        return int(re.search(r"(\d+)\.\d+\.\d+", output).group(1))
+    except Exception as e:
+        logging.warning(f"Could not determine the Chrome version: {e}")
+        return 0
+
+def prepare_chromedriver() -> str:
+    """Path of a patched chromedriver matching the installed Chrome, downloading and patching it once."""
+    global _chromedriver_path
+    with _chromedriver_lock:
+        if _chromedriver_path:
+            return _chromedriver_path
+        major = chrome_major_version()
+        name = f"chromedriver_{major or 'latest'}" + (".exe" if os.name == "nt" else "")
+        path = os.path.join(CHROMEDRIVER_CACHE, name)
+        patcher = uc.Patcher(executable_path=path)
+        if not (major and patcher.is_binary_patched(path)):
+            logging.info(f"Preparing patched chromedriver for Chrome {major or '(latest)'}.")
+            fresh = uc.Patcher(version_main=major)
+            fresh.auto()
+            os.makedirs(CHROMEDRIVER_CACHE, exist_ok=True)
+            staging = f"{path}.{os.getpid()}.tmp"
+            shutil.copy2(fresh.executable_path, staging)
+            os.replace(staging, path)  # Atomic, so concurrent processes never run a partial binary.
+        _chromedriver_path = path
+        return path
+
+# -------------------------------
+# Deadlines
+# -------------------------------
+class Deadline:
+    """
+    Wall-clock budget, optionally nested in a parent (e.g. a per-source budget
+    inside the sweep deadline). `seconds=None` means no limit of its own.
+    """
+
+    def __init__(self, seconds: float = None, parent: "Deadline" = None, name: str = "deadline"):
+        self.expires = None if seconds is None else time.monotonic() + seconds
+        self.parent = parent
+        self.name = name
+
+    def remaining(self) -> float:
+        own = float("inf") if self.expires is None else self.expires - time.monotonic()
+        return min(own, self.parent.remaining()) if self.parent else own
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def reason(self) -> str:
+        """Name of the (innermost-first) deadline that has run out, or None."""
+        if self.parent and self.parent.expired():
+            return self.parent.reason()
+        if self.expires is not None and time.monotonic() >= self.expires:
+            return self.name
+        return None
+
+    def binding(self) -> str:
+        """
+        Name of the deadline with the least time left, i.e. the one that stops
+        work first. Unlike reason() it names a deadline before it expires.
+        """
+        own = float("inf") if self.expires is None else self.expires - time.monotonic()
+        if self.parent and self.parent.remaining() <= own:
+            return self.parent.binding()
+        return self.name
+
+    def cap(self, seconds: float) -> float:
+        """Clamp a timeout to the time left (never negative)."""
+        return max(0.0, min(seconds, self.remaining()))
+
+    def sleep(self, seconds: float):
+        time.sleep(self.cap(seconds))
+
+# A deadline that never expires, used when callers do not pass one.
+NO_DEADLINE = Deadline()
+
+# -------------------------------
+# Per-domain politeness
+# -------------------------------
+# Second-level labels under which registrations happen in ccTLDs
+# (e.g. customs.gov.dm, www.zimra.co.zw, www.customs.go.jp).
+COMMON_SECOND_LEVEL_DOMAINS = {"ac", "co", "com", "edu", "go", "gob", "gouv", "gov", "govt", "gub", "gv",
+                               "mil", "net", "nic", "or", "org"}
+
+def registered_domain(url: str) -> str:
+    """Approximate the registered domain of a URL (e.g. taxation-customs.ec.europa.eu -> europa.eu)."""
+    host = (urlsplit((url or "").strip()).hostname or "").lower().rstrip(".")
+    labels = host.split(".")
+    if len(labels) < 2 or host.replace(".", "").isdigit():
+        return host
+    if len(labels) >= 3 and len(labels[-1]) == 2 and labels[-2] in COMMON_SECOND_LEVEL_DOMAINS:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst` tokens."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Take a token and return how long the caller must wait before using it."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+class DomainScheduler:
+    """
+    Enforces per-registered-domain concurrency and request-rate limits on
+    browser navigation and clicks, shared by all browsers in the process.
+    """
+
+    def __init__(self, max_concurrency: int = 2, rate: float = 0.5, burst: int = 2):
+        self.cond = Condition()
+        self.configure(max_concurrency, rate, burst)
+
+    def configure(self, max_concurrency: int, rate: float, burst: int):
+        with self.cond:
+            self.max_concurrency = max_concurrency
+            self.rate = rate
+            self.burst = burst
+            self.active = {}
+            self.buckets = {}
+
+    @contextmanager
+    def slot(self, url: str):
+        """Hold one of the domain's concurrent request slots, paced by its token bucket."""
+        domain = registered_domain(url)
+        with self.cond:
+            while self.active.get(domain, 0) >= self.max_concurrency:
+                self.cond.wait()
+            self.active[domain] = self.active.get(domain, 0) + 1
+            bucket = self.buckets.setdefault(domain, TokenBucket(self.rate, self.burst))
+            delay = bucket.reserve()
+        try:
+            if delay > 0:
+                logging.info(f"Rate limiting {domain}: waiting {delay:.1f}s.")
+                time.sleep(delay)
+            yield
+        finally:
+            with self.cond:
+                self.active[domain] -= 1
+                self.cond.notify_all()
+
+domain_scheduler = DomainScheduler()
+
+class SourceQueue:
+    """
+    Thread-safe work queue that hands each worker the next source whose
+    domain is not already being crawled by `max_per_domain` workers, so the
+    pool keeps busy on other domains instead of queueing behind one host.
+    """
+
+    def __init__(self, sources: list, max_per_domain: int):
+        self.pending = list(sources)
+        self.max_per_domain = max_per_domain
+        self.active = {}
+        self.cond = Condition()
+
+    def _take(self):
+        for index, source in enumerate(self.pending):
+            domain = registered_domain(source.get("link"))
+            if self.active.get(domain, 0) < self.max_per_domain:
+                self.active[domain] = self.active.get(domain, 0) + 1
+                return self.pending.pop(index)
+        return None
+
+    def get(self):
+        """Return the next eligible source, blocking while all remaining domains are busy; None when empty."""
+        with self.cond:
+            while self.pending:
+                source = self._take()
+                if source is not None:
+                    return source
+                self.cond.wait()
+            return None
+
+    def try_get(self):
+        """Non-blocking get(): None if nothing is eligible right now."""
+        with self.cond:
+            return self._take()
+
+    def __len__(self):
+        with self.cond:
+            return len(self.pending)
+
+    def requeue(self, source: dict):
+        """Put a source back at the front of the queue (call task_done for it first)."""
+        with self.cond:
+            self.pending.insert(0, source)
+            self.cond.notify_all()
+
+    def task_done(self, source: dict):
+        with self.cond:
+            self.active[registered_domain(source.get("link"))] -= 1
+            self.cond.notify_all()
+
+# -------------------------------
+# Adaptive Concurrency
+# -------------------------------
+try:
+    import psutil
+except ImportError:  # Optional: fall back to /proc on Linux.
+    psutil = None
+    logging.info("psutil is not installed; reading process and memory figures from /proc (Linux only).")
+
+class AdaptiveLimiter:
+    """
+    Semaphore whose limit can be changed at runtime, with AIMD helpers:
+    increase() adds one slot, decrease() halves the limit. Slots already
+    held are never revoked; a lower limit takes effect as they are released.
+    """
+
+    def __init__(self, limit: int, min_limit: int = 1, max_limit: int = None, name: str = "limiter"):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit or limit
+        self.limit = max(min_limit, min(limit, self.max_limit))
+        self.in_use = 0
+        self.cond = Condition()
+
+    def try_acquire(self) -> bool:
+        with self.cond:
+            if self.in_use >= self.limit:
+                return False
+            self.in_use += 1
+            return True
+
+    def acquire(self):
+        with self.cond:
+            while self.in_use >= self.limit:
+                self.cond.wait()
+            self.in_use += 1
+
+    def release(self):
+        with self.cond:
+            self.in_use -= 1
+            self.cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def saturated(self) -> bool:
+        return self.in_use >= self.limit
+
+    def settled(self) -> bool:
+        """True once no more slots are held than the limit allows, i.e. the last cut took effect."""
+        return self.in_use <= self.limit
+
+    def configure(self, limit: int, max_limit: int = None):
+        with self.cond:
+            self.max_limit = max(limit, max_limit or limit)
+            self.limit = max(self.min_limit, limit)
+            self.cond.notify_all()
+
+    def set_limit(self, limit: int):
+        with self.cond:
+            self.limit = max(self.min_limit, min(int(limit), self.max_limit))
+            self.cond.notify_all()
+
+    def increase(self):
+        old = self.limit
+        self.set_limit(self.limit + 1)
+        if self.limit != old:
+            logging.info(f"{self.name}: concurrency {old} -> {self.limit}")
+
+    def decrease(self):
+        old = self.limit
+        self.set_limit(self.limit // 2)
+        if self.limit != old:
+            logging.info(f"{self.name}: concurrency {old} -> {self.limit}")
+
+# Active browser sessions and in-flight gpt-4o requests. Fixed unless an
+# AdaptiveController is running (see --adaptive).
+browser_limiter = AdaptiveLimiter(4, name="browser sessions")
+llm_limiter = AdaptiveLimiter(64, name="LLM requests")
+
+class LLMStats:
+    """Sliding window of gpt-4o call latencies and failures."""
+
+    def __init__(self, window: int = 50):
+        self.lock = Lock()
+        self.calls = deque(maxlen=window)
+
+    def observe(self, latency: float, error: bool):
+        with self.lock:
+            self.calls.append((latency, error))
+
+    def clear(self):
+        """Forget the window, e.g. after acting on it, so only later calls are judged."""
+        with self.lock:
+            self.calls.clear()
+
+    def snapshot(self) -> tuple:
+        """Returns (number of calls, mean latency of successful calls, error rate)."""
+        with self.lock:
+            calls = list(self.calls)
+        if not calls:
+            return 0, 0.0, 0.0
+        latencies = [latency for latency, error in calls if not error]
+        mean_latency = sum(latencies) / len(latencies) if latencies else 0.0
+        return len(calls), mean_latency, sum(error for _, error in calls) / len(calls)
+
+llm_stats = LLMStats()
+
+# Browsers alive in this process, for memory accounting.
+live_browsers = weakref.WeakSet()
+
+def _proc_stat(pid) -> list:
+    """Fields of /proc/<pid>/stat after the command name (state is [0], parent pid [1], RSS pages [21])."""
+    with open(f"/proc/{pid}/stat") as f:
+        return f.read().rsplit(")", 1)[1].split()
+
+def process_tree(pid: int) -> list:
+    """Pids of a process and all its descendants (empty if unknown)."""
+    if not pid:
+        return []
+    if psutil:
+        try:
+            return [pid] + [child.pid for child in psutil.Process(pid).children(recursive=True)]
+        except psutil.Error:
+            return []
+    # /proc fallback: build the parent map once, then walk down from pid.
+    children = {}
+    for entry in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        if not entry.isdigit():
+            continue
+        try:
+            children.setdefault(int(_proc_stat(entry)[1]), []).append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+def process_tree_rss(pid: int) -> int:
+    """Resident memory in bytes of a process and all its descendants (0 if unknown)."""
+    total = 0
+    for member in process_tree(pid):
+        try:
+            if psutil:
+                total += psutil.Process(member).memory_info().rss
+            else:
+                total += int(_proc_stat(member)[21]) * os.sysconf("SC_PAGE_SIZE")
+        except Exception:  # The process exited meanwhile.
+            continue
+    return total
+
+def process_alive(pid: int) -> bool:
+    """True if `pid` exists and is not a zombie."""
+    if psutil:
+        try:
+            return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+        except psutil.Error:
+            return False
+    try:
+        return _proc_stat(pid)[0] != "Z"
+    except (OSError, IndexError):
+        try:
+            os.kill(pid, 0)
+            return True
+        except PermissionError:
+            return True
+        except OSError:
+            return False
+
+def system_memory() -> tuple:
+    """Returns (available bytes, total bytes) of system memory."""
+    if psutil:
+        memory = psutil.virtual_memory()
+        return memory.available, memory.total
+    info = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            info[key] = int(value.split()[0]) * 1024
+    return info.get("MemAvailable", info.get("MemFree", 0)), info.get("MemTotal", 0)
+
+def system_cpu_load() -> float:
+    """1-minute load average per core (1.0 means all cores busy)."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except OSError:
+        return 0.0
+
+class AdaptiveController:
+    """
+    AIMD controller run on a background thread. Every `interval` seconds it
+    halves browser sessions when free memory is low, when another Chrome
+    would not fit, or when the CPUs are overloaded, and adds one session
+    when there is headroom and all sessions are busy. The number of
+    in-flight LLM requests is halved when gpt-4o errors (e.g. rate limits)
+    or latency rise and grows by one while the limit is saturated.
+
+    Slots already held are not revoked, so a limit is not cut again until
+    its holders are back within it, and the LLM window is cleared after a
+    cut: each decision is then based on what happened after the last one.
+    """
+
+    def __init__(self, browsers: AdaptiveLimiter, llm: AdaptiveLimiter, stats: LLMStats,
+                 interval: float = 10, min_free_memory: float = 0.15, max_cpu_load: float = 0.9,
+                 max_llm_error_rate: float = 0.1, max_llm_latency: float = 30):
+        self.browsers = browsers
+        self.llm = llm
+        self.stats = stats
+        self.interval = interval
+        self.min_free_memory = min_free_memory
+        self.max_cpu_load = max_cpu_load
+        self.max_llm_error_rate = max_llm_error_rate
+        self.max_llm_latency = max_llm_latency
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="adaptive-controller", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.adjust()
+            except Exception as e:
+                logging.error(f"Adaptive controller tick failed: {e}")
+
+    def adjust(self):
+        available, total = system_memory()
+        free = available / total if total else 1.0
+        load = system_cpu_load()
+        browsers = list(live_browsers)
+        chrome_rss = sum(process_tree_rss(browser.pid) for browser in browsers)
+        per_browser = chrome_rss / len(browsers) if browsers else 0
+        logging.info(f"Controller: {free:.0%} memory free, load {load:.2f}/core, "
+                     f"{len(browsers)} Chrome using {chrome_rss / 2**20:.0f} MiB.")
+        if free < self.min_free_memory or load > self.max_cpu_load:
+            if self.browsers.settled():
+                self.browsers.decrease()
+            else:
+                logging.info(f"Controller: waiting for {self.browsers.in_use - self.browsers.limit} "
+                             f"browser sessions to finish before cutting further.")
+            browser_pool.trim(max(0, self.browsers.limit - self.browsers.in_use))
+        elif (self.browsers.saturated() and available - per_browser > self.min_free_memory * total
+              and load < self.max_cpu_load * 0.8):
+            self.browsers.increase()
+
+        calls, latency, error_rate = self.stats.snapshot()
+        if calls:
+            if error_rate > self.max_llm_error_rate or latency > self.max_llm_latency:
+                if self.llm.settled():
+                    self.llm.decrease()
+                    self.stats.clear()
+            elif self.llm.saturated():
+                self.llm.increase()
 
 # -------------------------------
 # Browser Class Definition
 # -------------------------------
+# URL patterns (Network.setBlockedURLs wildcards) for each blockable resource type.
+RESOURCE_TYPE_PATTERNS = {
+    "image": ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico", "*.bmp"],
+    "font": ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"],
+    "media": ["*.mp4", "*.webm", "*.mp3", "*.ogg", "*.m4a", "*.mov", "*.m3u8",
+              "*youtube.com/embed*", "*youtube-nocookie.com*", "*player.vimeo.com*"],
+    "social": ["*connect.facebook.net*", "*platform.twitter.com*", "*platform.linkedin.com*",
+               "*addthis.com*", "*sharethis.com*", "*instagram.com/embed*"],
+    "analytics": ["*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*hotjar.com*",
+                  "*clarity.ms*", "*matomo.js*", "*piwik.js*", "*/gtag/js*"],
+}
+
+class ResourcePolicy:
+    """
+    Which subresources a Browser blocks through the DevTools protocol: whole
+    resource types (keys of RESOURCE_TYPE_PATTERNS) plus extra URL patterns.
+    `allow` maps a registered domain to the types or patterns it needs, for
+    sites whose layout breaks without them.
+    """
+
+    def __init__(self, block_types=(), block_patterns=(), allow: dict = None):
+        unknown = set(block_types) - set(RESOURCE_TYPE_PATTERNS)
+        if unknown:
+            raise ValueError(f"Unknown resource types: {', '.join(sorted(unknown))}")
+        self.block_types = list(block_types)
+        self.block_patterns = list(block_patterns)
+        self.allow = {domain.lower(): list(items) for domain, items in (allow or {}).items()}
+
+    def blocked_urls(self, url: str) -> list:
+        """Patterns to block while on `url`, after applying that site's allowlist."""
+        allowed = self.allow.get(registered_domain(url), [])
+        patterns = []
+        for kind in self.block_types:
+            if kind not in allowed:
+                patterns.extend(RESOURCE_TYPE_PATTERNS[kind])
+        patterns.extend(self.block_patterns)
+        return [pattern for pattern in patterns if pattern not in allowed]
+
+# Tunables shared by every Browser in the process (set from the command line
+# and forwarded to worker processes).
+browser_settings = {
+    "ready_max_wait": 5.0,  # Upper bound on waiting for a page to settle, in seconds.
+    "ready_settle": 0.5,    # Quiet period (no DOM mutations, no requests) that counts as settled.
+    "click_max_wait": 3.0,  # How long to wait for a click to have a visible effect.
+    "resource_policy": None,  # ResourcePolicy applied by default to new browsers.
+    # Pooled browsers are replaced once any of these is reached (0 disables a limit).
+    "recycle_pages": 200,      # Page loads, including navigating clicks.
+    "recycle_uptime": 1800.0,  # Seconds since launch.
+    "recycle_rss_mb": 1500,    # Resident memory of the Chrome process tree.
+    # The Watchdog kills a browser whose driver command runs longer than this (0 disables it).
+    "watchdog_timeout": 120.0,
+    "profile_template": None,  # Chrome profile directory copied into each new browser.
+    "disk_cache_dir": None,    # Shared HTTP cache seed kept across browsers and sweeps.
+    "disk_cache_size": 256 * 1024 * 1024,  # Per-browser cache bound, in bytes.
+    "chromedriver_path": None,  # Patched chromedriver; prepared on first launch when unset.
+    "launch_concurrency": 4,  # Chrome launches allowed at once.
+    # Screenshots tried in turn until the model decides on an action: a small
+    # cheap image first, then a full-size one before falling back to HTML only.
+    # "capture" holds Browser.capture_screenshot arguments, "detail" the
+    # vision detail level requested from the model.
+    "screenshot_tiers": [
+        {"capture": {"image_format": "jpeg", "quality": 60, "scale": 0.5}, "detail": "low"},
+        {"capture": {"image_format": "jpeg", "quality": 80, "scale": 1.0}, "detail": "high"},
+    ],
+}
+
+# Installed in every new document (and injected on demand when missing):
+# counts in-flight fetch/XHR requests and records the time of the last
+# network or DOM activity, so readiness can be decided without fixed sleeps.
+READINESS_INSTRUMENTATION = """
+(() => {
+  if (window.__crawlReady) return;
+  const state = window.__crawlReady = {pending: 0, last: performance.now(), docId: Math.random().toString(36).slice(2)};
+  const touch = () => { state.last = performance.now(); };
+  const origFetch = window.fetch;
+  if (origFetch) {
+    window.fetch = function(...args) {
+      state.pending++; touch();
+      return origFetch.apply(this, args).finally(() => { state.pending--; touch(); });
+    };
+  }
+  const origSend = XMLHttpRequest.prototype.send;
+  XMLHttpRequest.prototype.send = function(...args) {
+    state.pending++; touch();
+    this.addEventListener("loadend", () => { state.pending--; touch(); }, {once: true});
+    return origSend.apply(this, args);
+  };
+  try {
+    new PerformanceObserver(touch).observe({type: "resource", buffered: false});
+  } catch (e) {}
+  const observe = () => new MutationObserver(touch).observe(document, {
+    subtree: true, childList: true, attributes: true, characterData: true});
+  if (document.documentElement) observe();
+  else document.addEventListener("DOMContentLoaded", observe, {once: true});
+  // Set when a navigation away starts: until the next document commits, this one still answers probes.
+  window.addEventListener("beforeunload", () => { state.leaving = true; });
+})();
+"""
+
+# Cheap fingerprint of the current document, compared before and after a click.
+PAGE_SIGNATURE = """
+const state = window.__crawlReady;
+const body = document.body;
+return {
+  url: location.href,
+  docId: state ? state.docId : null,
+  leaving: state ? !!state.leaving : false,
+  readyState: document.readyState,
+  dom: document.getElementsByTagName("*").length + ":" + (body ? body.innerText.length : 0),
+};
+"""
+
+# Outcomes returned by Browser.click_element.
+CLICK_NAVIGATED = "navigated"      # New URL or new document.
+CLICK_DOM_CHANGED = "dom_changed"  # Same document, but its content changed.
+CLICK_NO_CHANGE = "no_change"      # Nothing happened within click_max_wait.
+
+READINESS_STATUS = """
+const state = window.__crawlReady;
+if (!state) return null;
+return {readyState: document.readyState, pending: state.pending, idle: performance.now() - state.last,
+        leaving: !!state.leaving};
+"""
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+              "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.6998.36 Safari/537.36")
+
+def chrome_options() -> uc.ChromeOptions:
+    options = uc.ChromeOptions()
+    options.add_argument("--headless")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument(f"user-agent={USER_AGENT}")
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_argument("--window-size=1920,1080")
+    # driver.get() returns as soon as the navigation starts; Browser.go_to_url
+    # waits for the load itself, without holding the Chrome's command lock,
+    # so tabs sharing the Chrome keep working while a page loads.
+    options.page_load_strategy = "none"
+    return options
+
+# -------------------------------
+# Profiles and disk cache
+# -------------------------------
+# Chrome profiles and caches cannot be shared by running instances, so each
+# browser gets its own copy: the profile from `profile_template`, and the
+# HTTP cache from the newest generation under `disk_cache_dir`. When a
+# healthy browser quits, its cache becomes a new generation (written aside
+# and renamed into place, so readers never see a partial copy), and only the
+# newest few generations are kept. Each copy is bounded by `disk_cache_size`.
+CACHE_DIR_NAME = "DiskCache"
+CACHE_GENERATIONS_KEPT = 2
+# Lock files of the template's last run, and caches (seeded separately).
+PROFILE_COPY_IGNORE = shutil.ignore_patterns("Singleton*", "lockfile", "LOCK", "Cache", "Code Cache",
+                                             "GPUCache", "Crashpad", CACHE_DIR_NAME)
+
+def ensure_profile_template(path: str):
+    """Initialize a profile template at `path` with one Chrome run, unless it already holds a profile."""
+    if os.path.isdir(path) and os.listdir(path):
+        return
+    logging.info(f"Creating Chrome profile template in {path}.")
+    os.makedirs(path, exist_ok=True)
+    with browser_launch_slots:
+        driver = uc.Chrome(options=chrome_options(), user_data_dir=path,
+                           driver_executable_path=browser_settings["chromedriver_path"] or prepare_chromedriver(),
+                           use_chromedriver_temp_dir=False)
+    try:
+        driver.get("about:blank")
+    finally:
+        driver.quit()
+
+def _cache_generations(root: str) -> list:
+    """Complete cache generations under `root`, oldest first."""
+    try:
+        return sorted(entry for entry in os.listdir(root) if entry.startswith("gen-"))
+    except OSError:
+        return []
+
+def make_profile_dir() -> str:
+    """A private user-data dir for a new browser, seeded from the template and the shared cache."""
+    profile_dir = tempfile.mkdtemp(prefix="crawl-profile-")
+    template = browser_settings["profile_template"]
+    cache_root = browser_settings["disk_cache_dir"]
+    try:
+        if template:
+            shutil.copytree(template, profile_dir, ignore=PROFILE_COPY_IGNORE, dirs_exist_ok=True)
+        generations = _cache_generations(cache_root) if cache_root else []
+        if generations:
+            shutil.copytree(os.path.join(cache_root, generations[-1]), os.path.join(profile_dir, CACHE_DIR_NAME))
+    except (OSError, shutil.Error) as e:
+        # A generation pruned mid-copy or a half-copied profile only costs warmth.
+        logging.warning(f"Could not fully seed browser profile {profile_dir}: {e}")
+    return profile_dir
+
+def save_disk_cache(cache_dir: str):
+    """Publish a quitting browser's cache as the newest generation under `disk_cache_dir`."""
+    cache_root = browser_settings["disk_cache_dir"]
+    if not cache_root or not os.path.isdir(cache_dir):
+        return
+    os.makedirs(cache_root, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=cache_root)
+    try:
+        shutil.copytree(cache_dir, staging, dirs_exist_ok=True)
+        os.rename(staging, os.path.join(cache_root, f"gen-{time.time_ns()}-{os.getpid()}"))
+    except (OSError, shutil.Error) as e:
+        logging.warning(f"Could not save browser disk cache: {e}")
+        shutil.rmtree(staging, ignore_errors=True)
+        return
+    for old in _cache_generations(cache_root)[:-CACHE_GENERATIONS_KEPT]:
+        shutil.rmtree(os.path.join(cache_root, old), ignore_errors=True)
+
 class Browser:
-    def __init__(self):
-        options = uc.ChromeOptions()
-        options.add_argument("--headless")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                             "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.6998.36 Safari/537.36")
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        options.add_argument("--window-size=1920,1080")
-        self.driver = uc.Chrome(options=options, use_chromedriver_temp_dir=False)
+    def __init__(self, resource_policy: ResourcePolicy = None):
+        options = chrome_options()
+        self.profile_dir = None
+        if browser_settings["profile_template"] or browser_settings["disk_cache_dir"]:
+            self.profile_dir = make_profile_dir()
+            options.add_argument(f"--disk-cache-dir={os.path.join(self.profile_dir, CACHE_DIR_NAME)}")
+            options.add_argument(f"--disk-cache-size={browser_settings['disk_cache_size']}")
+        try:
+            self.driver = uc.Chrome(options=options, user_data_dir=self.profile_dir,
+                                    driver_executable_path=browser_settings["chromedriver_path"] or prepare_chromedriver(),
+                                    use_chromedriver_temp_dir=False)
+        except Exception:
+            if self.profile_dir:
+                shutil.rmtree(self.profile_dir, ignore_errors=True)
+            raise
+        self.pid = getattr(self.driver, "browser_pid", None)
+        self.started = time.monotonic()
+        self.pages_served = 0
+        # Watched by the Watchdog: when the driver command in flight (if any)
+        # started, when the last one finished, and why the browser was killed.
+        self.command_started = None
+        self.heartbeat = self.started
+        self.killed = None
+        self.closed = False
+        live_browsers.add(self)
         self.wait_time = 10
+        self.page_load_timeout = 60
+        self.visited_origins = set()
+        self.lock = RLock()
+        self.resource_policy = resource_policy or browser_settings["resource_policy"]
+        self.blocked_urls = {}  # window handle -> patterns currently blocked in that tab
+        self._install_readiness_instrumentation()
 
-    def go_to_url(self, url: str, retries=3) -> bool:
+    def _install_readiness_instrumentation(self):
+        """Register the readiness script in the current tab (CDP scripts are per tab)."""
+        try:
+            self.driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument",
+                                        {"source": READINESS_INSTRUMENTATION})
+        except Exception as e:
+            logging.warning(f"Could not install readiness instrumentation, injecting per page instead: {e}")
+
+    @contextmanager
+    def _on(self, handle: str = None):
+        """
+        Serialize driver commands and, when `handle` is given, switch to that
+        tab first. Several sources can share one Chrome in separate tabs; each
+        browser operation then runs atomically against its own tab.
+        """
+        with self.lock:
+            outermost = self.command_started is None
+            if outermost:
+                self.command_started = time.monotonic()
+            try:
+                if handle is not None and self.driver.current_window_handle != handle:
+                    self.driver.switch_to.window(handle)
+                yield
+            finally:
+                if outermost:
+                    self.command_started = None
+                    self.heartbeat = time.monotonic()
+
+    def apply_resource_policy(self, url: str, handle: str = None):
+        """Block the policy's resources for `url` in the given tab (CDP settings are per tab)."""
+        if self.resource_policy is None:
+            return
+        patterns = self.resource_policy.blocked_urls(url)
+        with self._on(handle):
+            current = self.driver.current_window_handle
+            if self.blocked_urls.get(current) == patterns:
+                return
+            if current not in self.blocked_urls:
+                self.driver.execute_cdp_cmd("Network.enable", {})
+            self.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+            self.blocked_urls[current] = patterns
+
+    def go_to_url(self, url: str, retries=3, deadline: Deadline = NO_DEADLINE, handle: str = None) -> bool:
         for attempt in range(retries):
+            if deadline.expired():
+                logging.warning(f"Deadline reached before loading {url}.")
+                return False
+            if self.killed:
+                return False
             try:
-                self.driver.get(url)
-                WebDriverWait(self.driver, self.wait_time).until(
-                    lambda d: d.execute_script("return document.readyState") == "complete"
-                )
-                current_url = self.driver.current_url
+                self.apply_resource_policy(url, handle)
+                with domain_scheduler.slot(url):
+                    with self._on(handle):
+                        before = self.driver.execute_script(PAGE_SIGNATURE)
+                        self.pages_served += 1
+                        self.driver.get(url)
+                    current_url, title = self._wait_for_load(before, deadline, handle)
+                self._remember_origin(current_url)
                 logging.info(f"Navigated to {url}, current URL: {current_url}")
-                if current_url.startswith("data:") or "404" in self.driver.title.lower():
+                if current_url.startswith("data:") or "404" in title.lower():
                     logging.warning(f"Navigation to {url} resulted in an invalid page.")
                     return False
                 return True
             except Exception as e:
                 logging.error(f"Attempt {attempt+1}/{retries} failed for {url}: {e}")
-                time.sleep(2 ** attempt)
+                if attempt + 1 < retries:
+                    deadline.sleep(2 ** attempt)
         return False
 
-    def get_page_source(self) -> str:
-        time.sleep(5)  # Wait briefly to allow dynamic content to load.
-        return self.driver.page_source
+    def _wait_for_load(self, before: dict, deadline: Deadline, handle: str = None) -> tuple:
+        """
+        Wait for the document that replaces `before` (a PAGE_SIGNATURE) to finish
+        loading, taking the lock only for each probe. Returns (url, title);
+        raises TimeoutException after `page_load_timeout` seconds.
+        """
+        limit = Deadline(self.page_load_timeout, parent=deadline)
+        while True:
+            try:
+                with self._on(handle):
+                    page = self.driver.execute_script(PAGE_SIGNATURE)
+                    # Without the instrumentation (docId None) only the ready state can be checked.
+                    if page["readyState"] == "complete" and not page["leaving"] \
+                            and (page["docId"] != before["docId"] or page["docId"] is None):
+                        return page["url"], self.driver.title
+            except Exception as e:
+                logging.debug(f"Load probe failed: {e}")  # Document swapped mid-probe.
+            if limit.expired():
+                raise TimeoutException(f"Page did not load within {self.page_load_timeout}s")
+            limit.sleep(0.1)
+
+    def _wait_clickable(self, xpath: str, deadline: Deadline, handle: str = None):
+        """Poll for a clickable element at `xpath`, taking the lock only for each probe."""
+        condition = EC.element_to_be_clickable((By.XPATH, xpath))
+        limit = Deadline(self.wait_time, parent=deadline)
+        while True:
+            try:
+                with self._on(handle):
+                    element = condition(self.driver)
+            except (NoSuchElementException, StaleElementReferenceException):
+                element = None
+            if element:
+                return element
+            if limit.expired():
+                raise TimeoutException(f"Element not clickable within {self.wait_time}s")
+            limit.sleep(0.25)
+
+    def wait_until_ready(self, deadline: Deadline = NO_DEADLINE, handle: str = None) -> bool:
+        """
+        Wait until the page has loaded, has no fetch/XHR in flight and has seen
+        no DOM mutation or network activity for `ready_settle` seconds. Gives
+        up after `ready_max_wait` seconds. Returns True if the page settled.
+        """
+        settle_ms = browser_settings["ready_settle"] * 1000
+        limit = Deadline(browser_settings["ready_max_wait"], parent=deadline)
+        started = time.monotonic()
+        while True:
+            try:
+                with self._on(handle):
+                    status = self.driver.execute_script(READINESS_STATUS)
+                    if status is None:
+                        # Instrumentation missing (e.g. CDP unavailable); it only sees activity from now on.
+                        self.driver.execute_script(READINESS_INSTRUMENTATION)
+            except Exception as e:
+                logging.debug(f"Readiness probe failed: {e}")
+                status = None
+            if status and status["readyState"] == "complete" and status["pending"] <= 0 \
+                    and status["idle"] >= settle_ms and not status["leaving"]:
+                logging.info(f"Page settled after {time.monotonic() - started:.1f}s.")
+                return True
+            if limit.expired():
+                logging.info(f"Page still busy after {time.monotonic() - started:.1f}s; continuing anyway.")
+                return False
+            limit.sleep(0.1)
 
-    def capture_screenshot(self) -> bytes:
-        """Return a screenshot as PNG bytes."""
-        return self.driver.get_screenshot_as_png()
+    def get_page_source(self, deadline: Deadline = NO_DEADLINE, handle: str = None) -> str:
+        self.wait_until_ready(deadline, handle=handle)
+        with self._on(handle):
+            # Clicks can land on origins go_to_url never saw; reset() must clear them too.
+            self._remember_origin(self.driver.current_url)
+            return self.driver.page_source
+
+    def capture_screenshot(self, handle: str = None, image_format: str = "png", quality: int = None,
+                           scale: float = 1.0, clip: dict = None) -> str:
+        """
+        Capture the viewport, or the `clip` rectangle ({"x", "y", "width",
+        "height"} in CSS pixels), through CDP Page.captureScreenshot. Returns a
+        data URL wrapping the base64 payload as the driver sent it, with no
+        decoding or re-encoding. `image_format` is "png", "jpeg" or "webp";
+        `quality` (0-100) applies to the lossy formats and `scale` < 1 shrinks
+        the image.
+        """
+        params = {"format": image_format}
+        if quality is not None and image_format != "png":
+            params["quality"] = quality
+        with self._on(handle):
+            try:
+                if clip is None and scale != 1.0:
+                    viewport = self.driver.execute_cdp_cmd("Page.getLayoutMetrics", {})["cssLayoutViewport"]
+                    clip = {"x": viewport["pageX"], "y": viewport["pageY"],
+                            "width": viewport["clientWidth"], "height": viewport["clientHeight"]}
+                if clip is not None:
+                    params["clip"] = dict(clip, scale=scale)
+                data = self.driver.execute_cdp_cmd("Page.captureScreenshot", params)["data"]
+            except Exception as e:
+                logging.warning(f"CDP screenshot failed, falling back to a PNG of the viewport: {e}")
+                data, image_format = self.driver.get_screenshot_as_base64(), "png"
+        return f"data:image/{image_format};base64,{data}"
+
+    def current_url(self, handle: str = None) -> str:
+        with self._on(handle):
+            return self.driver.current_url
+
+    def new_tab(self) -> str:
+        """Open a blank tab, set up like the first one, and return its window handle."""
+        with self._on():
+            self.driver.switch_to.new_window("tab")
+            handle = self.driver.current_window_handle
+            self._install_readiness_instrumentation()
+            self.apply_resource_policy("about:blank", handle)
+            return handle
+
+    def close_tab(self, handle: str):
+        with self._on():
+            if handle in self.driver.window_handles:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+            self.blocked_urls.pop(handle, None)
+            self.driver.switch_to.window(self.driver.window_handles[0])
 
     def quit(self):
+        self.closed = True
         try:
             self.driver.quit()
         except Exception as e:
             logging.error(f"Error during driver.quit(): {e}")
+        profile_dir, self.profile_dir = self.profile_dir, None
+        if profile_dir:
+            if not self.killed:  # A killed Chrome may have left its cache half-written.
+                save_disk_cache(os.path.join(profile_dir, CACHE_DIR_NAME))
+            shutil.rmtree(profile_dir, ignore_errors=True)
 
-    def click_element(self, xpath: str) -> bool:
-        """Click an element based on its XPath."""
+    def is_healthy(self) -> bool:
+        """True if the driver still answers commands."""
         try:
-            element = WebDriverWait(self.driver, self.wait_time).until(
-                EC.element_to_be_clickable((By.XPATH, xpath))
-            )
-            element.click()
+            with self._on():
+                return self.driver.execute_script("return 1") == 1 and bool(self.driver.window_handles)
+        except Exception:
+            return False
+
+    def hang_reason(self, command_timeout: float) -> str:
+        """Why the watchdog should kill this browser (a stuck driver command or a dead process), or None."""
+        started = self.command_started
+        if started is not None and time.monotonic() - started > command_timeout:
+            return f"driver command running for {time.monotonic() - started:.0f}s"
+        if self.pid and not process_alive(self.pid):
+            return "Chrome process died"
+        service = getattr(getattr(self.driver, "service", None), "process", None)
+        if service is not None and service.poll() is not None:
+            return "chromedriver exited"
+        return None
+
+    def kill(self, reason: str):
+        """
+        Forcefully end Chrome and chromedriver. Driver commands blocked on
+        them fail promptly, and the pool replaces the browser.
+        """
+        self.killed = reason
+        for pid in reversed(process_tree(self.pid)):
+            try:
+                os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+            except OSError:
+                pass
+        service = getattr(getattr(self.driver, "service", None), "process", None)
+        if service is not None:
+            try:
+                service.kill()
+            except OSError:
+                pass
+
+    def recycle_reason(self) -> str:
+        """Why this browser is due for replacement under the recycle_* settings, or None."""
+        pages = browser_settings["recycle_pages"]
+        if pages and self.pages_served >= pages:
+            return f"served {self.pages_served} pages"
+        uptime = time.monotonic() - self.started
+        if browser_settings["recycle_uptime"] and uptime >= browser_settings["recycle_uptime"]:
+            return f"up for {uptime:.0f}s"
+        rss_mb = process_tree_rss(self.pid) / 2**20 if browser_settings["recycle_rss_mb"] else 0
+        if rss_mb >= browser_settings["recycle_rss_mb"] > 0:
+            return f"using {rss_mb:.0f} MB"
+        return None
+
+    def reset(self):
+        """
+        Return the browser to a clean state between sources: replace all tabs
+        with a fresh one on about:blank, and clear cookies and per-origin
+        storage. The HTTP cache is kept on purpose so repeat visits stay fast.
+        """
+        with self._on():
+            # sessionStorage lives with the tab (CDP cannot clear it per origin),
+            # so the next source gets a new tab rather than the old one.
+            handles = self.driver.window_handles
+            self.new_tab()
+            for handle in handles:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+                self.blocked_urls.pop(handle, None)
+            self.driver.switch_to.window(self.driver.window_handles[0])
+            # delete_all_cookies() only covers the current document's domain.
+            self.driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            for origin in self.visited_origins:
+                self.driver.execute_cdp_cmd("Storage.clearDataForOrigin", {
+                    "origin": origin,
+                    "storageTypes": "local_storage,indexeddb,websql,service_workers,cache_storage",
+                })
+            self.visited_origins.clear()
+
+    def click_element(self, xpath: str, deadline: Deadline = NO_DEADLINE, handle: str = None):
+        """
+        Click an element based on its XPath and wait for the click to take
+        effect. Returns CLICK_NAVIGATED, CLICK_DOM_CHANGED or CLICK_NO_CHANGE,
+        or None if the element could not be clicked. A link that opens a new
+        window is followed in the current tab and the window closed.
+        """
+        try:
+            element = self._wait_clickable(xpath, deadline, handle)
+            with self._on(handle):
+                before = self.driver.execute_script(PAGE_SIGNATURE)
+                handles_before = set(self.driver.window_handles)
+            with domain_scheduler.slot(before["url"]), self._on(handle):
+                element.click()
             logging.info(f"Clicked element with XPath: {xpath}")
-            return True
         except (NoSuchElementException, TimeoutException) as e:
             logging.error(f"Failed to click element with XPath {xpath}: {e}")
-            return False
+            return None
+
+        limit = Deadline(browser_settings["click_max_wait"], parent=deadline)
+        navigating = False
+        while True:
+            new_windows, after = set(), None
+            try:
+                with self._on(handle):
+                    new_windows = set(self.driver.window_handles) - handles_before
+                    after = None if new_windows else self.driver.execute_script(PAGE_SIGNATURE)
+            except Exception as e:
+                # The old document went away mid-probe.
+                logging.debug(f"Page signature probe failed after click: {e}")
+            if new_windows:
+                return self._follow_new_window(new_windows.pop(), deadline, handle)
+            if after is not None and (after["url"] != before["url"] or after["docId"] != before["docId"]):
+                return self._click_navigated(handle, after["url"])
+            if not navigating and (after is None or after["leaving"]):
+                # A navigation is under way: give the next document up to a page load to commit.
+                navigating = True
+                limit = Deadline(self.page_load_timeout, parent=deadline)
+            if not navigating and after["dom"] != before["dom"]:
+                return CLICK_DOM_CHANGED
+            if limit.expired():
+                if navigating:
+                    return self._click_navigated(handle)
+                logging.info(f"Click on {xpath} had no visible effect.")
+                return CLICK_NO_CHANGE
+            limit.sleep(0.1)
+
+    def _click_navigated(self, handle: str = None, url: str = None) -> str:
+        """Book-keeping for a click that loaded a new document (url is None if not known yet)."""
+        self.pages_served += 1
+        try:
+            if url is None:
+                with self._on(handle):
+                    url = self.driver.current_url
+            self._remember_origin(url)
+            # The click may have left the domain go_to_url set the block list for.
+            self.apply_resource_policy(url, handle)
+        except Exception as e:
+            logging.warning(f"Could not update the resource policy after a click: {e}")
+        return CLICK_NAVIGATED
+
+    def _remember_origin(self, url: str):
+        """Note a web origin whose storage reset() has to clear."""
+        if url.startswith(("http://", "https://")):
+            self.visited_origins.add(origin_of(url))
+
+    def _follow_new_window(self, new_handle: str, deadline: Deadline, handle: str = None) -> str:
+        # Pages load without blocking the driver, so the new window may not have its URL yet.
+        limit = Deadline(browser_settings["click_max_wait"], parent=deadline)
+        while True:
+            with self._on(new_handle):
+                url = self.driver.current_url
+            if url not in ("", "about:blank") or limit.expired():
+                break
+            limit.sleep(0.1)
+        with self._on():
+            self.driver.switch_to.window(new_handle)
+            self.driver.close()
+            self.driver.switch_to.window(handle or self.driver.window_handles[0])
+        logging.info(f"Click opened a new window at {url}; following it in the current tab.")
+        if url in ("", "about:blank"):
+            return CLICK_NO_CHANGE
+        return CLICK_NAVIGATED if self.go_to_url(url, deadline=deadline, handle=handle) else None
+
+class BrowserTab:
+    """
+    One tab of a shared Browser. Exposes the same crawl API as Browser, bound
+    to the tab's window handle, so process_tariff_source can use either.
+    """
+
+    def __init__(self, browser: Browser, handle: str):
+        self.browser = browser
+        self.handle = handle
+
+    def go_to_url(self, url: str, retries=3, deadline: Deadline = NO_DEADLINE) -> bool:
+        return self.browser.go_to_url(url, retries, deadline, handle=self.handle)
+
+    def get_page_source(self, deadline: Deadline = NO_DEADLINE) -> str:
+        return self.browser.get_page_source(deadline, handle=self.handle)
+
+    def capture_screenshot(self, **options) -> str:
+        return self.browser.capture_screenshot(handle=self.handle, **options)
+
+    def current_url(self) -> str:
+        return self.browser.current_url(handle=self.handle)
+
+    def click_element(self, xpath: str, deadline: Deadline = NO_DEADLINE):
+        return self.browser.click_element(xpath, deadline, handle=self.handle)
+
+def origin_of(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+class BrowserCrashed(Exception):
+    """The browser serving a source hung or died and was killed by the Watchdog."""
+
+def launch_browser() -> Browser:
+    with browser_launch_slots:
+        return Browser()
 
-def get_thread_browser():
-    if not hasattr(thread_local, "browser"):
-        with browser_init_lock:
-            thread_local.browser = Browser()
-    return thread_local.browser
+class BrowserPool:
+    """
+    Pool of reusable Browser instances. A source checks a browser out, and on
+    check-in the browser is reset and kept for the next source instead of
+    paying for another Chrome cold start. Idle browsers are health-checked
+    before reuse and replaced if their driver stopped responding.
+
+    With `tabs_per_browser` > 1, sessions are tabs instead: each Chrome
+    serves up to that many sources at once, one tab each.
+
+    Browsers past a recycle threshold (see Browser.recycle_reason) are not
+    reused: a replacement is launched in the background while the old one
+    quits, and checkouts wait for it rather than starting another Chrome.
+
+    With `warm` > 0 (see prewarm) the pool keeps that many idle browsers
+    launched ahead of demand, refilling in the background as they are
+    checked out, so sources rarely wait on a Chrome cold start.
+    """
+
+    def __init__(self, max_idle: int = None, tabs_per_browser: int = 1):
+        self.max_idle = max_idle
+        self.tabs_per_browser = tabs_per_browser
+        self.warm = 0
+        self.idle = []
+        self.shared = {}  # Browser -> number of open source tabs
+        self.draining = set()  # Shared browsers due for recycling: no new tabs
+        self.launching = 0  # Background launches in progress
+        self.waiting = 0  # Checkouts waiting for one of them
+        self.lock = Lock()
+        self.launched = Condition(self.lock)
+
+    def checkout(self) -> Browser:
+        while True:
+            with self.lock:
+                while not self.idle and self.launching > self.waiting:
+                    self.waiting += 1
+                    self.launched.wait()
+                    self.waiting -= 1
+                browser = self.idle.pop() if self.idle else None
+            self._refill()
+            if browser is None:
+                return launch_browser()
+            if browser.is_healthy():
+                return browser
+            logging.warning("Discarding unresponsive pooled browser.")
+            browser.quit()
+
+    def checkin(self, browser: Browser):
+        reason = browser.recycle_reason()
+        if reason:
+            self.recycle(browser, reason)
+            return
+        try:
+            browser.reset()
+        except Exception as e:
+            logging.warning(f"Failed to reset browser, discarding it: {e}")
+            browser.quit()
+            return
+        with self.lock:
+            if self.max_idle is None or len(self.idle) < self.max_idle:
+                self.idle.append(browser)
+                self.launched.notify_all()
+                return
+        browser.quit()
+
+    def discard(self, browser: Browser):
+        browser.quit()
+
+    def prewarm(self, count: int):
+        """Keep `count` idle browsers launched ahead of demand (0 stops pre-warming)."""
+        with self.lock:
+            self.warm = count
+        self._refill()
+
+    def recycle(self, browser: Browser, reason: str):
+        """Quit `browser` and launch its replacement into the idle pool in the background."""
+        logging.info(f"Recycling browser (pid {browser.pid}): {reason}.")
+        self._launch_idle(browser)
+
+    def _refill(self):
+        with self.lock:
+            missing = self.warm - len(self.idle) - self.launching + self.waiting
+        for _ in range(missing):
+            self._launch_idle()
+
+    def _launch_idle(self, old: Browser = None):
+        with self.lock:
+            self.launching += 1
+        threading.Thread(target=self._run_launch, args=(old,), name="browser-launch", daemon=True).start()
+
+    def _run_launch(self, old: Browser = None):
+        browser = None
+        try:
+            browser = launch_browser()
+            # Get the tab ready for the first navigation: block list installed, parked on about:blank.
+            browser.apply_resource_policy("about:blank")
+        except Exception as e:
+            logging.error(f"Failed to launch browser in the background: {e}")
+            if browser is not None:
+                browser.quit()
+                browser = None
+        finally:
+            with self.lock:
+                self.launching -= 1
+                keep = browser is not None and (self.max_idle is None or len(self.idle) < self.max_idle)
+                if keep:
+                    self.idle.append(browser)
+                self.launched.notify_all()
+        if browser is not None and not keep:
+            browser.quit()
+        if old is not None:
+            old.quit()
+
+    @contextmanager
+    def session(self):
+        """
+        Check out a browser (or, in tab mode, a BrowserTab) for one source; a
+        whole browser is discarded if the source raised.
+        """
+        if self.tabs_per_browser > 1:
+            with self._tab_session() as tab:
+                yield tab
+            return
+        browser = self.checkout()
+        try:
+            yield browser
+        except BaseException as e:
+            if browser.killed:
+                self.recycle(browser, browser.killed)
+                raise BrowserCrashed(browser.killed) from e
+            self.discard(browser)
+            raise
+        if browser.killed:
+            self.recycle(browser, browser.killed)
+            raise BrowserCrashed(browser.killed)
+        self.checkin(browser)
+
+    @contextmanager
+    def _tab_session(self):
+        with self.lock:
+            # A Chrome killed by the watchdog takes no new tabs; it is replaced once its last tab closes.
+            self.draining.update(b for b in self.shared if b.killed)
+            browser = next((b for b, tabs in self.shared.items()
+                            if tabs < self.tabs_per_browser and b not in self.draining), None)
+            if browser is not None:
+                self.shared[browser] += 1
+        if browser is None:
+            browser = self.checkout()
+            with self.lock:
+                self.shared[browser] = 1
+        handle = None
+        try:
+            handle = browser.new_tab()
+            yield BrowserTab(browser, handle)
+        finally:
+            try:
+                if handle is not None:
+                    browser.close_tab(handle)
+            except Exception as e:
+                logging.warning(f"Failed to close tab: {e}")
+            with self.lock:
+                self.shared[browser] -= 1
+                retire = self.shared[browser] == 0
+                if retire:
+                    del self.shared[browser]
+                    self.draining.discard(browser)
+            if not retire and browser not in self.draining and browser.recycle_reason():
+                with self.lock:
+                    if browser in self.shared:
+                        self.draining.add(browser)
+            # A Chrome with no sources left goes back to the idle pool, so it
+            # is reset (cookies, storage) only when no other tab is using it.
+            if retire:
+                if browser.killed:
+                    self.recycle(browser, browser.killed)
+                elif browser.is_healthy():
+                    self.checkin(browser)
+                else:
+                    self.discard(browser)
+            if browser.killed:
+                raise BrowserCrashed(browser.killed)
+
+    def trim(self, max_idle: int):
+        """Quit idle browsers beyond `max_idle`; pre-warming is capped to match."""
+        with self.lock:
+            self.warm = min(self.warm, max_idle)
+            extra = self.idle[max_idle:]
+            del self.idle[max_idle:]
+        for browser in extra:
+            browser.quit()
+
+    def close(self):
+        with self.lock:
+            self.warm = 0
+            while self.launching:
+                self.launched.wait()
+        self.trim(0)
+        with self.lock:
+            shared = list(self.shared)
+            self.shared.clear()
+        for browser in shared:
+            browser.quit()
+
+browser_pool = BrowserPool()
+
+# A re-queued source that crashes its browser again is reported as failed.
+MAX_CRASH_REQUEUES = 1
+
+class Watchdog:
+    """
+    Background monitor for every live Browser in the process. Every
+    `interval` seconds it kills browsers whose current driver command has
+    run for more than `command_timeout` seconds, or whose Chrome or
+    chromedriver process is gone. Blocked commands then fail at once instead
+    of waiting out Selenium's timeouts and retries; the pool replaces the
+    browser and the runner re-queues the source (see BrowserCrashed).
+    """
+
+    def __init__(self, command_timeout: float = 120, interval: float = 5):
+        self.command_timeout = command_timeout
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="browser-watchdog", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logging.error(f"Watchdog tick failed: {e}")
+
+    def check(self):
+        for browser in list(live_browsers):
+            if browser.killed or browser.closed:
+                continue
+            reason = browser.hang_reason(self.command_timeout)
+            if reason:
+                logging.error(f"Watchdog: killing browser (pid {browser.pid}): {reason}.")
+                browser.kill(reason)
+
+# -------------------------------
+# gpt-4o Calls
+# -------------------------------
+def create_chat_completion(messages: list, timeout: float = 60):
+    """Call gpt-4o within the in-flight limit, recording latency and errors for the controller."""
+    with llm_limiter:
+        started = time.monotonic()
+        try:
+            response = client.chat.completions.create(model="gpt-4o", messages=messages, timeout=timeout)
+        except Exception:
+            llm_stats.observe(time.monotonic() - started, True)
+            raise
+        llm_stats.observe(time.monotonic() - started, False)
+        return response
+
+async def create_chat_completion_async(messages: list, timeout: float = 60):
+    """Async counterpart of create_chat_completion."""
+    while not llm_limiter.try_acquire():
+        await asyncio.sleep(0.1)
+    try:
+        started = time.monotonic()
+        try:
+            response = await async_client.chat.completions.create(model="gpt-4o", messages=messages,
+                                                                  timeout=timeout)
+        except Exception:
+            llm_stats.observe(time.monotonic() - started, True)
+            raise
+        llm_stats.observe(time.monotonic() - started, False)
+        return response
+    finally:
+        llm_limiter.release()
 
 # -------------------------------
 # Tariff Update Extraction Function
@@ -131,11 +1494,7 @@ HTML Content:
     ]
     logging.info("Sending prompt to gpt-4o for tariff update extraction.")
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            timeout=60
-        )
+        response = create_chat_completion(messages, timeout=60)
         # Access the response (a pydantic model) to get the message content.
         ai_output = response.choices[0].message.content
         logging.info(f"gpt-4o extraction response: {ai_output}")
@@ -159,7 +1518,53 @@ HTML Content:
 # -------------------------------
 # (Optional) AI Action Analysis Functions
 # -------------------------------
-def analyze_page_for_action(html: str, screenshot_png: bytes) -> dict:
+ACTION_SYSTEM_PROMPT_SUFFIX = (
+    "Analyze them and decide the next action to take to find tariff updates. Return a JSON object with keys: "
+    "'action' (either 'click' or 'type'), 'xpath' (the XPath of the target element), "
+    "'text' (if action is 'type', else omit), 'description' explaining your decision, and 'alternatives' "
+    "(a list of up to 3 other promising actions, best first, each with the same keys except 'alternatives'). "
+    "If you can extract tariff updates based on the current HTML, return a JSON array of updates instead, using keys 'date', 'title', 'summary', and 'link' for each update. It is extremely important that the output is valid JSON. If no action can be determined, return an empty JSON object: `{}`."
+)
+
+def build_action_messages(html: str, screenshot: str, detail: str = "auto") -> list:
+    """Build the chat messages for the HTML + screenshot (a data URL) action analysis."""
+    return [
+        {"role": "system", "content": (
+            "You are a web automation agent controlling a browser. You are given both the HTML of the page and a screenshot. "
+            + ACTION_SYSTEM_PROMPT_SUFFIX
+        )},
+        {"role": "user", "content": f"HTML:\n{html[:4000]}\n\n(HTML truncated for brevity.)"},  # Increased HTML limit
+        {"role": "user", "content": [
+            {"type": "text", "text": "Screenshot of the page:"},
+            {"type": "image_url", "image_url": {"url": screenshot, "detail": detail}},
+        ]}
+    ]
+
+def build_html_only_messages(html: str) -> list:
+    """Build the chat messages for the HTML-only fallback analysis."""
+    return [
+        {"role": "system", "content": (
+            "You are a web automation agent controlling a browser. You are given the HTML of the page. "
+            + ACTION_SYSTEM_PROMPT_SUFFIX.replace("Analyze them", "Analyze it")
+        )},
+        {"role": "user", "content": f"HTML:\n{html[:4000]}\n\nWhat action should be taken next?"}
+    ]
+
+def parse_action_output(ai_output: str, label: str = "action analysis"):
+    """Extract the JSON action object (or updates array) from a gpt-4o response. Returns {} if none."""
+    try:
+        # Use regex to find the JSON part of the response (action or updates)
+        match = re.search(r"(\[.*\]|\{.*\})", ai_output, re.DOTALL)  # Matches arrays and objects
+        if match:
+            json_string = match.group(1)
+            return json.loads(json_string)
+        logging.warning(f"No JSON found in GPT-4o output for {label}.")
+        return {}
+    except json.JSONDecodeError as e:
+        logging.error(f"Failed to parse gpt-4o output for {label} as JSON. Error: {e}, Output: {ai_output}")
+        return {}
+
+def analyze_page_for_action(html: str, screenshot: str, timeout: float = 60, detail: str = "auto") -> dict:
     """
     Uses gpt-4o to analyze both HTML and screenshot and determine the next action.
     Returns a JSON object with:
@@ -170,122 +1575,426 @@ def analyze_page_for_action(html: str, screenshot_png: bytes) -> dict:
     If no action is determined, returns {}.
     """
     try:
-        image_b64 = base64.b64encode(screenshot_png).decode('utf-8')
-        messages = [
-            {"role": "system", "content": (
-                "You are a web automation agent controlling a browser. You are given both the HTML of the page and a screenshot (encoded in base64). "
-                "Analyze them and decide the next action to take to find tariff updates. Return a JSON object with keys: "
-                "'action' (either 'click' or 'type'), 'xpath' (the XPath of the target element), "
-                "'text' (if action is 'type', else omit), and 'description' explaining your decision. "
-                "If you can extract tariff updates based on the current HTML, return a JSON array of updates instead, using keys 'date', 'title', 'summary', and 'link' for each update. It is extremely important that the output is valid JSON. If no action can be determined, return an empty JSON object: `{}`."
-            )},
-            {"role": "user", "content": f"HTML:\n{html[:4000]}\n\n(HTML truncated for brevity.)"},  # Increased HTML limit
-            {"role": "user", "content": "[IMAGE]", "image_data": image_b64}
-        ]
-        logging.info("Sending prompt to gpt-4o with HTML and screenshot.")
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            timeout=60
-        )
+        messages = build_action_messages(html, screenshot, detail)
+        logging.info(f"Sending prompt to gpt-4o with HTML and screenshot ({detail} detail).")
+        response = create_chat_completion(messages, timeout=timeout)
         ai_output = response.choices[0].message.content
         logging.info(f"gpt-4o response: {ai_output}")
-        try:
-            # Use regex to find the JSON part of the response (action or updates)
-            match = re.search(r"(\[.*\]|\{.*\})", ai_output, re.DOTALL)  # Matches arrays and objects
-            if match:
-                json_string = match.group(1)
-                action_obj = json.loads(json_string)
-                return action_obj
-            else:
-                logging.warning("No JSON found in GPT-4o output for action analysis.")
-                return {}
-
-        except json.JSONDecodeError as e:
-            logging.error(f"Failed to parse gpt-4o output as JSON. Error: {e}, Output: {ai_output}")
-            return {}
+        return parse_action_output(ai_output)
     except Exception as e:
         logging.error(f"Error during gpt-4o call: {e}")
         return {}
 
-def analyze_page_for_action_html_only(html: str) -> dict:
+def analyze_page_for_action_html_only(html: str, timeout: float = 60) -> dict:
     """
     Fallback analysis using HTML only via gpt-4o.
     """
     try:
-        messages = [
-            {"role": "system", "content": (
-                "You are a web automation agent controlling a browser. You are given the HTML of the page. "
-                "Analyze it and decide the next action to take to find tariff updates. Return a JSON object with keys: "
-                "'action' (either 'click' or 'type'), 'xpath' (the XPath of the target element), "
-                "'text' (if action is 'type', else omit), and 'description' explaining your decision. "
-                "If you can extract tariff updates based on the current HTML, return a JSON array of updates instead, using keys 'date', 'title', 'summary', and 'link' for each update. It is extremely important that the output is valid JSON. If no action can be determined, return an empty JSON object: `{}`."
-            )},
-            {"role": "user", "content": f"HTML:\n{html[:4000]}\n\nWhat action should be taken next?"}
-        ]
+        messages = build_html_only_messages(html)
         logging.info("Sending HTML-only prompt to gpt-4o for fallback analysis.")
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            timeout=60
-        )
+        response = create_chat_completion(messages, timeout=timeout)
         ai_output = response.choices[0].message.content
         logging.info(f"gpt-4o (HTML-only) response: {ai_output}")
-        try:
-            # Use regex to find the JSON part of the response (action or updates)
-            match = re.search(r"(\[.*\]|\{.*\})", ai_output, re.DOTALL)  # Matches arrays and objects
-            if match:
-                json_string = match.group(1)
-                action_obj = json.loads(json_string)
-                return action_obj
-            else:
-                logging.warning("No JSON found in GPT-4o output for HTML-only action analysis.")
-                return {}
-        except json.JSONDecodeError as e:
-            logging.error(f"Failed to parse gpt-4o (HTML-only) output as JSON. Error: {e}, Output: {ai_output}")
-            return {}
+        return parse_action_output(ai_output, "HTML-only action analysis")
     except Exception as e:
         logging.error(f"Error during HTML-only gpt-4o call: {e}")
         return {}
 
+async def analyze_page_for_action_async(html: str, screenshot: str, timeout: float = 60,
+                                        detail: str = "auto") -> dict:
+    """Async counterpart of analyze_page_for_action using the AsyncOpenAI client."""
+    try:
+        messages = build_action_messages(html, screenshot, detail)
+        logging.info(f"Sending prompt to gpt-4o with HTML and screenshot ({detail} detail, async).")
+        response = await create_chat_completion_async(messages, timeout=timeout)
+        ai_output = response.choices[0].message.content
+        logging.info(f"gpt-4o response: {ai_output}")
+        return parse_action_output(ai_output)
+    except Exception as e:
+        logging.error(f"Error during async gpt-4o call: {e}")
+        return {}
+
+async def analyze_page_for_action_html_only_async(html: str, timeout: float = 60) -> dict:
+    """Async counterpart of analyze_page_for_action_html_only."""
+    try:
+        messages = build_html_only_messages(html)
+        logging.info("Sending HTML-only prompt to gpt-4o for fallback analysis (async).")
+        response = await create_chat_completion_async(messages, timeout=timeout)
+        ai_output = response.choices[0].message.content
+        logging.info(f"gpt-4o (HTML-only) response: {ai_output}")
+        return parse_action_output(ai_output, "HTML-only action analysis")
+    except Exception as e:
+        logging.error(f"Error during async HTML-only gpt-4o call: {e}")
+        return {}
+
+# -------------------------------
+# Plain HTTP Tier
+# -------------------------------
+# Many portals are server-rendered, so a crawl first tries to work on plain
+# HTTP fetches over a pooled client and the HTML-only prompt. It escalates to
+# Chrome (from the URL it got to) when a page looks like a JS shell or is too
+# thin to judge, when a click target is not a plain link, or when the model
+# cannot decide on the HTML alone.
+try:
+    from lxml import html as lxml_html
+except ImportError:  # Without lxml only XPaths naming the href literally can be followed.
+    lxml_html = None
+    logging.warning("lxml is not installed; the HTTP tier only follows XPaths that name the href literally.")
+
+http_settings = {
+    "enabled": True,
+    "timeout": 15.0,  # Per request.
+    "max_bytes": 5 * 1024 * 1024,  # Larger responses are left to the browser.
+    "min_text": 400,  # Visible characters a page needs to be worth reading without a browser.
+    "min_links": 3,
+}
+
+SCRIPT_STYLE_RE = re.compile(r"<(script|style|noscript|template)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+TAG_RE = re.compile(r"<[^>]+>")
+LINK_RE = re.compile(r"<a\b[^>]*\bhref\s*=\s*[\"']?(?!#|javascript:)[^\"'\s>]", re.IGNORECASE)
+JS_SHELL_RE = re.compile(
+    r"<div[^>]+id=[\"'](root|app|__next|__nuxt|main-app)[\"'][^>]*>\s*</div>"
+    r"|enable javascript|javascript is (required|disabled)|<app-root",
+    re.IGNORECASE,
+)
+HREF_IN_XPATH_RE = re.compile(r"@href\s*=\s*[\"']([^\"']+)[\"']")
+
+_http_pool = None
+_http_pool_lock = Lock()
+
+def http_pool() -> urllib3.PoolManager:
+    """
+    The process-wide pooled HTTP client, created on first use. Unlike the
+    preflight pool it verifies certificates: its pages go to gpt-4o and their
+    links to customers, so it must not accept what Chrome would reject.
+    """
+    global _http_pool
+    with _http_pool_lock:
+        if _http_pool is None:
+            _http_pool = make_http_pool(maxsize=32, verify=True)
+        return _http_pool
+
+def is_meaningful_html(html: str) -> tuple:
+    """Whether `html` can be judged without rendering. Returns (ok, reason)."""
+    text = " ".join(TAG_RE.sub(" ", SCRIPT_STYLE_RE.sub(" ", html)).split())
+    if len(text) < http_settings["min_text"]:
+        if JS_SHELL_RE.search(html):
+            return False, "JavaScript-rendered shell"
+        return False, f"only {len(text)} characters of text"
+    if len(LINK_RE.findall(html)) < http_settings["min_links"]:
+        return False, "too few links"
+    return True, "ok"
+
+def fetch_page(url: str, deadline: Deadline = NO_DEADLINE) -> dict:
+    """
+    Fetch `url` over plain HTTP. Returns a page state like the browser's
+    ({"ok", "url", "html", "screenshot": None, "tier": "http"}), or None if
+    the page needs a browser.
+    """
+    if deadline.remaining() < MIN_LLM_TIMEOUT:
+        return None
+    try:
+        with domain_scheduler.slot(url):
+            response = http_pool().request("GET", url, timeout=deadline.cap(http_settings["timeout"]),
+                                           redirect=True, preload_content=False)
+            try:
+                content_type = response.headers.get("Content-Type", "")
+                if response.status >= 400 or "html" not in content_type.lower():
+                    logging.info(f"HTTP tier: {url} returned {response.status} {content_type}; escalating.")
+                    return None
+                body = response.read(http_settings["max_bytes"] + 1)
+            finally:
+                response.release_conn()
+    except urllib3.exceptions.HTTPError as e:
+        if isinstance(getattr(e, "reason", e), urllib3.exceptions.SSLError):
+            # Chrome applies its own certificate checks (and shows what it rejects).
+            logging.info(f"HTTP tier: certificate of {url} could not be verified ({e}); escalating.")
+        else:
+            logging.info(f"HTTP tier: fetching {url} failed ({e}); escalating.")
+        return None
+    if len(body) > http_settings["max_bytes"]:
+        logging.info(f"HTTP tier: {url} is larger than {http_settings['max_bytes']} bytes; escalating.")
+        return None
+    charset = re.search(r"charset=([\w-]+)", content_type)
+    try:
+        html = body.decode(charset.group(1) if charset else "utf-8", errors="replace")
+    except LookupError:
+        html = body.decode("utf-8", errors="replace")
+    ok, reason = is_meaningful_html(html)
+    if not ok:
+        logging.info(f"HTTP tier: {url} needs a browser ({reason}).")
+        return None
+    # After redirects response.url may be only the path of the final request.
+    return {"ok": True, "url": urljoin(url, response.url or url), "html": html, "screenshot": None,
+            "tier": "http"}
+
+def resolve_link(html: str, xpath: str, base_url: str) -> str:
+    """The absolute URL a click on `xpath` would navigate to, or None if it is not a plain link."""
+    href = None
+    if lxml_html is not None:
+        try:
+            matches = lxml_html.fromstring(html).xpath(xpath)
+        except Exception:
+            matches = []
+        for element in matches[:1]:
+            if not hasattr(element, "iterancestors"):
+                href = str(element)  # The XPath selected the attribute itself.
+                break
+            for node in [element, *element.iterancestors()]:
+                if node.tag == "a" and node.get("href"):
+                    href = node.get("href")
+                    break
+    else:
+        match = HREF_IN_XPATH_RE.search(xpath or "")
+        href = match.group(1) if match else None
+    if not href or href.strip().lower().startswith(("#", "javascript:", "mailto:", "tel:")):
+        return None
+    return urljoin(base_url, href.strip())
+
+def _crawl_with_http(source: dict, stats: dict, deadline: Deadline) -> tuple:
+    """
+    Run the interaction loop on plain HTTP fetches. Returns (updates, None)
+    when the source was settled here, or (None, url) to carry on in Chrome
+    from `url`.
+    """
+    market = source.get("market")
+    url = source.get("link")
+    page = fetch_page(url, deadline)
+    while page is not None:
+        url = page["url"]
+        stats["last_url"] = url
+        if stats["iterations"] >= MAX_ITERATIONS:
+            logging.warning("Maximum iterations reached. Extraction incomplete.")
+            return [], None
+        if deadline.remaining() < MIN_LLM_TIMEOUT:
+            stats["stopped"] = deadline.reason() or deadline.binding()
+            logging.warning(f"{market}: {stats['stopped']} reached after {stats['iterations']} iterations "
+                            f"at {url}; stopping.")
+            return [], None
+        stats["iterations"] += 1
+        logging.info(f"Iteration {stats['iterations']} of interaction loop (HTTP tier).")
+        action_obj = analyze_page_for_action_html_only(page["html"], timeout=deadline.cap(60))
+        stats["llm_calls"] += 1
+        if isinstance(action_obj, list):
+            logging.info("Tariff updates extracted directly by GPT-4o.")
+            stats["tier"] = "http"
+            return action_obj, None
+        if not action_obj or action_obj.get("action") != "click":
+            break  # The screenshot prompt may do better; "type" needs a browser anyway.
+        target = resolve_link(page["html"], action_obj.get("xpath"), url)
+        logging.info(f"Action determined: click, XPath: {action_obj.get('xpath')}, link: {target}, "
+                     f"Description: {action_obj.get('description', 'No description')}")
+        if target is None:
+            break
+        url = target
+        page = fetch_page(url, deadline)
+    logging.info(f"{market}: escalating to Chrome at {url}.")
+    return None, url
+
+# -------------------------------
+# Page State Memory
+# -------------------------------
+# Each page state a crawl analyzes is fingerprinted by its URL plus a hash of
+# the normalized DOM (and a perceptual hash of the cheap screenshot when
+# Pillow is installed). A screenshot match alone only counts after a page
+# load, where volatile markup can defeat the DOM hash: a same-URL DOM change
+# (pagination, "load more", a tab switch) may leave the viewport thumbnail
+# unchanged. When a click fails, changes nothing or leads back to
+# a known state, the crawl skips the capture and the gpt-4o call and goes on
+# with the next-ranked action the model proposed for that state, or
+# backtracks to an earlier page that still has untried actions.
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow, states are matched on URL and DOM only.
+    Image = None
+    logging.warning("Pillow is not installed; page states are matched on URL and DOM only.")
+
+COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+# Attributes that change between loads of the same page (nonces, tokens, generated ids).
+VOLATILE_ATTR_RE = re.compile(
+    r"\s(nonce|integrity|value|data-[\w-]*(id|token|time|stamp)[\w-]*|[\w-]*csrf[\w-]*)"
+    r"\s*=\s*(\"[^\"]*\"|'[^']*'|[^\s>]+)",
+    re.IGNORECASE,
+)
+LONG_NUMBER_RE = re.compile(r"\d{6,}")  # Timestamps, cache busters, session ids.
+PHASH_MAX_DISTANCE = 4  # Differing bits (out of 64) for two screenshots to count as the same.
+
+def dom_fingerprint(html: str) -> str:
+    """Hash of the page's markup with scripts, comments and volatile values stripped."""
+    text = COMMENT_RE.sub("", SCRIPT_STYLE_RE.sub("", html))
+    text = LONG_NUMBER_RE.sub("#", VOLATILE_ATTR_RE.sub("", text))
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8", errors="replace")).hexdigest()
+
+def perceptual_hash(screenshot: str) -> int:
+    """64-bit difference hash of a screenshot data URL, or None without Pillow."""
+    if Image is None or not screenshot:
+        return None
+    try:
+        data = base64.b64decode(screenshot.split(",", 1)[1])
+        pixels = list(Image.open(io.BytesIO(data)).convert("L").resize((9, 8)).getdata())
+    except Exception as e:
+        logging.debug(f"Could not hash screenshot: {e}")
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits
+
+class StateMemory:
+    """
+    Page states analyzed during one crawl, each with the actions the model
+    ranked for it (its answer followed by its "alternatives") and how many of
+    them have been tried.
+    """
+
+    def __init__(self):
+        self.states = []
+
+    def find(self, url: str, dom: str = None, phash: int = None) -> dict:
+        """
+        The known state at `url` with the same DOM hash, or a near-identical
+        screenshot. Pass no `phash` after a click changed the DOM in place.
+        """
+        for state in self.states:
+            if state["url"] != url:
+                continue
+            if dom is not None and state["dom"] == dom:
+                return state
+            if phash is not None and state["phash"] is not None \
+                    and bin(phash ^ state["phash"]).count("1") <= PHASH_MAX_DISTANCE:
+                return state
+        return None
+
+    def add(self, url: str, dom: str, phash: int, action_obj: dict) -> dict:
+        candidates = [action_obj] if action_obj else []
+        for alternative in (action_obj or {}).get("alternatives") or []:
+            if isinstance(alternative, dict) and alternative.get("action"):
+                candidates.append(alternative)
+        state = {"url": url, "dom": dom, "phash": phash, "candidates": candidates, "tried": 0}
+        self.states.append(state)
+        return state
+
+    def next_action(self, state: dict) -> dict:
+        """The state's best action not tried yet (now marked as tried), or None."""
+        if state["tried"] >= len(state["candidates"]):
+            return None
+        state["tried"] += 1
+        return state["candidates"][state["tried"] - 1]
+
+    def backtrack(self, path: list) -> dict:
+        """Drop states from the end of `path` back to the latest one with untried actions, and return it."""
+        for index in range(len(path) - 2, -1, -1):
+            if path[index]["tried"] < len(path[index]["candidates"]):
+                del path[index + 1:]
+                return path[index]
+        return None
+
 # -------------------------------
 # Process a Tariff Source
 # -------------------------------
-def process_tariff_source(source: dict):
+# LLM calls with less time than this left before the deadline are not started.
+MIN_LLM_TIMEOUT = 5
+MAX_ITERATIONS = 10  # Limit to prevent infinite loops
+
+def process_tariff_source(source: dict, stats: dict = None, deadline: Deadline = NO_DEADLINE):
+    """
+    Crawl a single source and return the list of tariff updates found.
+    Returns None if the source URL could not be loaded.
+    If `stats` is given it is filled with the crawl cost: "iterations",
+    "llm_calls" and "elapsed" (seconds). When `deadline` runs out the crawl
+    stops early; "stopped" then names the deadline and "last_url" records
+    how far it got.
+    """
     market = source.get("market")
     url = source.get("link")
     logging.info(f"Processing market: {market} at {url}")
-    browser = get_thread_browser()
+    stats = {} if stats is None else stats
+    stats.update(iterations=0, llm_calls=0)
+    started = time.monotonic()
+    try:
+        if http_settings["enabled"]:
+            updates, url = _crawl_with_http(source, stats, deadline)
+            if url is None:
+                return updates
+        with browser_pool.session() as browser:
+            return _crawl_with_browser(browser, source, url, stats, deadline)
+    finally:
+        stats["elapsed"] = time.monotonic() - started
+
+def _crawl_with_browser(browser: Browser, source: dict, url: str, stats: dict, deadline: Deadline):
+    market = source.get("market")
+    stats["tier"] = "browser"
     try:
-        if not browser.go_to_url(url):
+        if not browser.go_to_url(url, deadline=deadline):
+            if deadline.expired():
+                stats["stopped"] = deadline.reason()
             logging.error("Failed to load URL.")
-            return
+            return None
 
         # Main loop for interaction and extraction
-        max_iterations = 10  # Limit to prevent infinite loops
-        for i in range(max_iterations):
+        memory = StateMemory()
+        path = []  # States leading to the current page, for backtracking
+        outcome = None  # Of the last click
+        for i in range(stats["iterations"], MAX_ITERATIONS):
+            if deadline.remaining() < MIN_LLM_TIMEOUT:
+                stats["stopped"] = deadline.reason() or deadline.binding()
+                stats["last_url"] = browser.current_url()
+                logging.warning(f"{market}: {stats['stopped']} reached after {i} iterations "
+                                f"at {stats['last_url']}; stopping.")
+                break
             logging.info(f"Iteration {i+1} of interaction loop.")
+            stats["iterations"] = i + 1
 
-            # Capture state: HTML and screenshot
-            html = browser.get_page_source()
-            screenshot = browser.capture_screenshot()
-
-            # Analyze page for action
-            action_obj = analyze_page_for_action(html, screenshot)
+            # Capture state: HTML, then screenshots from the cheapest tier up,
+            # unless this page state was already analyzed during the crawl.
+            html = browser.get_page_source(deadline=deadline)
+            page_url = browser.current_url()
+            dom = dom_fingerprint(html)
+            state = memory.find(page_url, dom=dom)
+            action_obj, phash = {}, None
+            for rank, tier in enumerate(browser_settings["screenshot_tiers"]):
+                if state or action_obj or deadline.remaining() < MIN_LLM_TIMEOUT:
+                    break
+                screenshot = browser.capture_screenshot(**tier["capture"])
+                if rank == 0:
+                    phash = perceptual_hash(screenshot)
+                    if outcome != CLICK_DOM_CHANGED:
+                        state = memory.find(page_url, phash=phash)
+                    if state:
+                        break
+                action_obj = analyze_page_for_action(html, screenshot, timeout=deadline.cap(60),
+                                                     detail=tier["detail"])
+                stats["llm_calls"] += 1
 
-            if not action_obj:
+            if not state and not action_obj and deadline.remaining() >= MIN_LLM_TIMEOUT:
                 logging.info("No action determined with screenshot, attempting HTML-only analysis.")
-                action_obj = analyze_page_for_action_html_only(html)
-
-            if not action_obj:
-                logging.info("No action determined after HTML-only analysis.  Stopping.")
-                break  # Stop if no action can be determined.
+                action_obj = analyze_page_for_action_html_only(html, timeout=deadline.cap(60))
+                stats["llm_calls"] += 1
 
             if isinstance(action_obj, list):  # GPT-4o returned updates directly
                 logging.info("Tariff updates extracted directly by GPT-4o.")
-                updates = action_obj
-                print(json.dumps(updates, indent=4))
-                return  # Exit the loop
+                return action_obj  # Exit the loop
+
+            if state:
+                logging.info(f"Page state at {page_url} was already analyzed; skipping capture and analysis.")
+                stats["repeated_states"] = stats.get("repeated_states", 0) + 1
+            else:
+                state = memory.add(page_url, dom, phash, action_obj)
+            if not path or path[-1] is not state:
+                path.append(state)
+
+            action_obj = memory.next_action(state)
+            if action_obj is None:
+                previous = memory.backtrack(path)
+                if previous is None:
+                    logging.info("No untried action left on this or any earlier page. Stopping.")
+                    break
+                logging.info(f"No untried action left here; backtracking to {previous['url']}.")
+                if not browser.go_to_url(previous["url"], deadline=deadline):
+                    break
+                outcome = None
+                continue
 
             action = action_obj.get("action")
             xpath = action_obj.get("xpath")
@@ -294,31 +2003,1300 @@ def process_tariff_source(source: dict):
 
             logging.info(f"Action determined: {action}, XPath: {xpath}, Text: {text}, Description: {description}")
 
+            # A click that fails or changes nothing leaves the page in a known
+            # state, so the next iteration moves on to the next-ranked action.
+            outcome = None
             if action == "click":
-                if not browser.click_element(xpath):
-                    logging.error(f"Failed to click element, stopping.")
-                    break
-                time.sleep(3)  # Give the page time to load after the click.
+                outcome = browser.click_element(xpath, deadline=deadline)
+                if not outcome:
+                    logging.error("Failed to click element, trying the next action.")
+                elif outcome == CLICK_NO_CHANGE:
+                    logging.warning("Click had no effect on the page, trying the next action.")
             elif action == "type":
                 # TODO: Implement typing into the element (requires finding the element and sending keys)
                 logging.warning("Typing action not yet implemented.")
-                break # stop further action if typing is needed
             else:
                 logging.warning(f"Unknown action: {action}")
-                break
         else:
             logging.warning("Maximum iterations reached. Extraction incomplete.")
+        return []
 
     finally:
-        browser.quit()
+        if "stopped" not in stats and deadline.expired():
+            stats["stopped"] = deadline.reason()
+            try:
+                stats["last_url"] = browser.current_url()
+            except Exception:
+                pass
+
+# -------------------------------
+# Batch Runner
+# -------------------------------
+def load_sources(path: str) -> list:
+    """Load the list of tariff sources (dicts with "market" and "link") from a JSON file."""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def normalize_link(link: str) -> str:
+    """
+    Normalize a source link for de-duplication: lower-case scheme and host,
+    drop default ports, fragments and trailing slashes.
+    """
+    link = (link or "").strip()
+    if "://" not in link and re.match(r"^[\w-]+(\.[\w-]+)+(:\d+)?(/\S*)?$", link):
+        link = "https://" + link  # Bare host such as "www.customs.gov.xx/news".
+    parts = urlsplit(link)
+    if not parts.scheme or not parts.netloc:
+        return link
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, parts.query, ""))
+
+def group_sources(sources: list) -> dict:
+    """Group sources by normalized link, preserving file order. Returns {normalized link: [sources]}."""
+    groups = {}
+    for source in sources:
+        groups.setdefault(normalize_link(source.get("link")), []).append(source)
+    return groups
+
+def fan_out_results(groups: dict, results: dict) -> dict:
+    """
+    Attach the result crawled for each group's first source to every market in
+    the group. `results` maps the representative market -> updates.
+    """
+    fanned = {}
+    for group in groups.values():
+        updates = results.get(group[0].get("market"))
+        for source in group:
+            fanned[source.get("market")] = updates
+    return fanned
+
+def run_batch(sources: list, workers: int = 4, on_start=None, on_result=None,
+              deadline: Deadline = NO_DEADLINE, source_budget: float = None) -> dict:
+    """
+    Run every source through process_tariff_source on a pool of worker threads.
+    Each worker checks a Browser out of the shared BrowserPool per source and pulls
+    the next source whose domain is not saturated from a shared SourceQueue.
+    At most `browser_limiter.limit` workers crawl at once.
+    `on_start(source)` and `on_result(source, updates, error, stats)` are called
+    from the worker threads as each source starts and finishes. No source is
+    started once the sweep `deadline` has passed, and each crawl is limited to
+    `source_budget` seconds.
+    Returns a dict mapping market -> list of updates (None if the source failed to load).
+    """
+    results = {}
+    results_lock = Lock()
+    work = SourceQueue(sources, domain_scheduler.max_concurrency)
+    crashes = {}  # market -> times its browser was killed
+
+    def worker():
+        while not deadline.expired():
+            with browser_limiter:
+                source = work.get()
+                if source is None:
+                    return
+                run_source(source)
+
+    def run_source(source):
+        market = source.get("market")
+        error = None
+        stats = {}
+        requeue = False
+        try:
+            if on_start:
+                on_start(source)
+            updates = process_tariff_source(source, stats,
+                                            Deadline(source_budget, parent=deadline, name="source_budget"))
+        except BrowserCrashed as e:
+            logging.error(f"Browser crashed while processing {market}: {e}")
+            updates, error = None, f"browser crashed: {e}"
+            with results_lock:
+                crashes[market] = crashes.get(market, 0) + 1
+                requeue = crashes[market] <= MAX_CRASH_REQUEUES
+        except Exception as e:
+            logging.error(f"Unhandled error while processing {market}: {e}")
+            updates, error = None, str(e)
+        finally:
+            work.task_done(source)
+        if requeue:
+            logging.info(f"Re-queueing {market} on a new browser.")
+            work.requeue(source)
+            return
+        if on_result:
+            on_result(source, updates, error, stats)
+        with results_lock:
+            results[market] = updates
+            logging.info(f"Finished {market} ({len(results)}/{len(sources)}).")
+
+    logging.info(f"Starting batch of {len(sources)} sources with {workers} workers.")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crawl") as executor:
+        for future in [executor.submit(worker) for _ in range(workers)]:
+            future.result()
+    return results
+
+# -------------------------------
+# Asyncio Pipeline
+# -------------------------------
+# Browser work and gpt-4o calls run as two separate stages joined by queues:
+# a small number of browser workers (each owning a Browser and running the
+# blocking Selenium calls on a dedicated thread) and a larger number of LLM
+# workers using the async client.
+#
+# Each source is pinned to one browser worker and gets its own tab there for
+# its whole crawl, so page state that is not reflected in the URL (e.g.
+# content revealed by a JS handler) carries over from one step to the next.
+# While a source waits for the model, its browser worker serves the other
+# sources' tabs, so a few Chrome instances keep many LLM requests in flight.
+# Only if the pinned browser crashes does a step re-navigate, in a new tab
+# of the replacement browser.
+
+def _pinned_tab(browser: Browser, pin: dict) -> BrowserTab:
+    """The source's tab on `browser`, opening one if it has none there yet (first step, or after a crash)."""
+    if pin["browser"] is not browser:
+        pin["browser"], pin["handle"] = browser, browser.new_tab()
+    return BrowserTab(browser, pin["handle"])
+
+def _close_pinned_tab(browser: Browser, pin: dict):
+    if pin["browser"] is browser and browser is not None and not browser.killed:
+        browser.close_tab(pin["handle"])
+    pin["browser"] = pin["handle"] = None
+
+def _browser_step(browser: Browser, job: dict) -> dict:
+    """Run one blocking browser job ("open" or "click") in the source's tab and capture the resulting page state."""
+    url = job["url"]
+    deadline = job["deadline"]
+    browser = _pinned_tab(browser, job["pin"])
+    if job["op"] == "open" or browser.current_url() != url:
+        if not browser.go_to_url(url, deadline=deadline):
+            return {"ok": False, "url": url}
+    outcome = None
+    if job["op"] == "click":
+        # The page is captured even if the click failed or changed nothing;
+        # the crawl then recognizes the state and moves on to another action.
+        outcome = browser.click_element(job["xpath"], deadline=deadline)
+    html = browser.get_page_source(deadline=deadline)
+    # Only the first (cheapest) tier: the model is called from the LLM stage,
+    # after this job has returned.
+    tier = browser_settings["screenshot_tiers"][0] if browser_settings["screenshot_tiers"] else None
+    screenshot = browser.capture_screenshot(**tier["capture"]) if tier else None
+    return {"ok": True, "url": browser.current_url(), "html": html, "screenshot": screenshot,
+            "detail": tier["detail"] if tier else None, "outcome": outcome}
+
+async def _browser_worker(browser_queue: asyncio.Queue, executor: ThreadPoolExecutor):
+    """Run the browser jobs of the sources pinned to this worker, one at a time, on its own Browser."""
+    loop = asyncio.get_running_loop()
+    try:
+        browser = await loop.run_in_executor(executor, browser_pool.checkout)
+    except Exception as e:
+        logging.error(f"Failed to start browser for async pipeline: {e}")
+        browser = None
+    try:
+        while True:
+            # Take a limiter slot only once a job is here: an idle worker holding
+            # one would starve workers whose pinned sources still have jobs queued
+            # after the adaptive controller shrinks the limit.
+            job, future = await browser_queue.get()
+            acquired = False
+            try:
+                if job["op"] == "close":
+                    await loop.run_in_executor(executor, _close_pinned_tab, browser, job["pin"])
+                    future.set_result({"ok": True})
+                    continue
+                while not browser_limiter.try_acquire():
+                    await asyncio.sleep(0.1)
+                acquired = True
+                if browser is None:
+                    future.set_result({"ok": False, "url": job["url"]})
+                    continue
+                for attempt in range(1 + MAX_CRASH_REQUEUES):
+                    try:
+                        result = await loop.run_in_executor(executor, _browser_step, browser, job)
+                    except Exception:
+                        if not browser.killed:
+                            raise
+                        result = {"ok": False, "url": job["url"]}
+                    if not browser.killed:
+                        break
+                    logging.warning(f"Browser crashed during {job['op']} on {job['url']} ({browser.killed}); "
+                                    f"retrying on a new browser.")
+                    killed, browser = browser, None
+                    await loop.run_in_executor(executor, browser_pool.recycle, killed, killed.killed)
+                    browser = await loop.run_in_executor(executor, browser_pool.checkout)
+                future.set_result(result)
+            except Exception as e:
+                logging.error(f"Browser job {job['op']} on {job['url']} failed: {e}")
+                future.set_result({"ok": False, "url": job["url"]})
+            finally:
+                if acquired:
+                    browser_limiter.release()
+                browser_queue.task_done()
+    finally:
+        if browser is not None:
+            await asyncio.shield(loop.run_in_executor(executor, browser_pool.checkin, browser))
+
+async def _llm_worker(llm_queue: asyncio.Queue):
+    while True:
+        (state, stats, deadline), future = await llm_queue.get()
+        try:
+            action_obj = {}
+            if state["screenshot"] is not None and deadline.remaining() >= MIN_LLM_TIMEOUT:
+                action_obj = await analyze_page_for_action_async(state["html"], state["screenshot"],
+                                                                 timeout=deadline.cap(60), detail=state["detail"])
+                stats["llm_calls"] += 1
+            if not action_obj and deadline.remaining() >= MIN_LLM_TIMEOUT:
+                logging.info("No action determined with screenshot, attempting HTML-only analysis.")
+                action_obj = await analyze_page_for_action_html_only_async(state["html"],
+                                                                           timeout=deadline.cap(60))
+                stats["llm_calls"] += 1
+            future.set_result(action_obj)
+        except Exception as e:
+            logging.error(f"LLM job failed: {e}")
+            future.set_result({})
+        finally:
+            llm_queue.task_done()
+
+async def _submit(queue: asyncio.Queue, item):
+    future = asyncio.get_running_loop().create_future()
+    await queue.put((item, future))
+    return await future
+
+async def _browser_job(pin: dict, **job) -> dict:
+    """Queue a job for the browser worker the source is pinned to and wait for its result."""
+    return await _submit(pin["queue"], dict(job, pin=pin))
+
+async def _crawl_source_async(source: dict, browser_queue: asyncio.Queue, llm_queue: asyncio.Queue,
+                              stats: dict, deadline: Deadline = NO_DEADLINE):
+    """
+    Asyncio counterpart of process_tariff_source; returns updates, or None if the
+    URL failed to load. `browser_queue` is the queue of the browser worker the
+    source is pinned to.
+    """
+    stats.update(iterations=0, llm_calls=0)
+    started = time.monotonic()
+    pin = {"queue": browser_queue, "browser": None, "handle": None}
+    try:
+        return await _crawl_source_steps(source, pin, llm_queue, stats, deadline)
+    finally:
+        if pin["handle"] is not None:
+            await _browser_job(pin, op="close", url=None)
+        stats["elapsed"] = time.monotonic() - started
+        if "stopped" not in stats and deadline.expired():
+            stats["stopped"] = deadline.reason()
+
+async def _crawl_source_steps(source: dict, pin: dict, llm_queue: asyncio.Queue,
+                              stats: dict, deadline: Deadline):
+    market = source.get("market")
+    url = source.get("link")
+    logging.info(f"Processing market: {market} at {url}")
+    state = None
+    if http_settings["enabled"]:
+        state = await asyncio.to_thread(fetch_page, url, deadline)
+    if state is None:
+        state = await _browser_job(pin, op="open", url=url, deadline=deadline)
+    if not state["ok"]:
+        logging.error(f"Failed to load URL for {market}.")
+        return None
+
+    memory = StateMemory()
+    path = []  # States leading to the current page, for backtracking
+    for i in range(MAX_ITERATIONS):
+        stats["last_url"] = state["url"]
+        if deadline.remaining() < MIN_LLM_TIMEOUT:
+            stats["stopped"] = deadline.reason() or deadline.binding()
+            logging.warning(f"{market}: {stats['stopped']} reached after {i} iterations "
+                            f"at {state['url']}; stopping.")
+            break
+        logging.info(f"{market}: iteration {i+1} of interaction loop.")
+        stats["iterations"] = i + 1
+        http_tier = state.get("tier") == "http"
+        known = None
+        if not http_tier:
+            dom, phash = dom_fingerprint(state["html"]), perceptual_hash(state["screenshot"])
+            known = memory.find(state["url"], dom=dom)
+            if not known and state.get("outcome") != CLICK_DOM_CHANGED:
+                known = memory.find(state["url"], phash=phash)
+        action_obj = {} if known else await _submit(llm_queue, (state, stats, deadline))
+        if isinstance(action_obj, list):  # GPT-4o returned updates directly
+            logging.info(f"{market}: tariff updates extracted directly by GPT-4o.")
+            stats["tier"] = state.get("tier", "browser")
+            return action_obj
+        if http_tier and (not action_obj or action_obj.get("action") != "click"):
+            # Let the screenshot prompt have a go; "type" needs a browser anyway.
+            logging.info(f"{market}: escalating to Chrome at {state['url']}.")
+            state = await _browser_job(pin, op="open", url=state["url"], deadline=deadline)
+            if not state["ok"]:
+                logging.error(f"Failed to load URL for {market}.")
+                break
+            continue
+        if not http_tier:
+            if known:
+                logging.info(f"{market}: page state at {state['url']} was already analyzed; skipping analysis.")
+                stats["repeated_states"] = stats.get("repeated_states", 0) + 1
+            else:
+                known = memory.add(state["url"], dom, phash, action_obj)
+            if not path or path[-1] is not known:
+                path.append(known)
+            action_obj = memory.next_action(known)
+            if action_obj is None:
+                previous = memory.backtrack(path)
+                if previous is None:
+                    logging.info(f"{market}: no untried action left on this or any earlier page. Stopping.")
+                    break
+                logging.info(f"{market}: no untried action left here; backtracking to {previous['url']}.")
+                state = await _browser_job(pin, op="open", url=previous["url"], deadline=deadline)
+                if not state["ok"]:
+                    logging.error(f"{market}: failed to load {previous['url']}, stopping.")
+                    break
+                continue
+
+        action = action_obj.get("action")
+        xpath = action_obj.get("xpath")
+        logging.info(f"{market}: action determined: {action}, XPath: {xpath}, "
+                     f"Description: {action_obj.get('description', 'No description')}")
+        if action == "click":
+            target = resolve_link(state["html"], xpath, state["url"]) if http_tier else None
+            next_state = await asyncio.to_thread(fetch_page, target, deadline) if target else None
+            if next_state is not None:
+                state = next_state
+                continue
+            if target:
+                logging.info(f"{market}: escalating to Chrome at {target}.")
+                state = await _browser_job(pin, op="open", url=target, deadline=deadline)
+            else:
+                # From the HTTP tier this opens the page in Chrome before clicking.
+                state = await _browser_job(pin, op="click", url=state["url"], xpath=xpath, deadline=deadline)
+            stats["tier"] = "browser"
+            if not state["ok"]:
+                logging.error(f"{market}: failed to load {state['url']}, stopping.")
+                break
+            if state.get("outcome") == CLICK_NO_CHANGE:
+                logging.warning(f"{market}: click had no effect on the page, trying the next action.")
+            elif not target and state.get("outcome") is None:
+                logging.error(f"{market}: failed to click element, trying the next action.")
+        elif action == "type":
+            logging.warning("Typing action not yet implemented.")
+        else:
+            logging.warning(f"Unknown action: {action}")
+    else:
+        logging.warning(f"{market}: maximum iterations reached. Extraction incomplete.")
+    return []
+
+async def run_async_pipeline(sources: list, browsers: int = 2, llm_concurrency: int = 16,
+                             on_start=None, on_result=None, deadline: Deadline = NO_DEADLINE,
+                             source_budget: float = None) -> dict:
+    """
+    Crawl sources with the asyncio pipeline: `browsers` Chrome instances and up to
+    `llm_concurrency` gpt-4o requests in flight. `on_start`/`on_result` and the
+    deadlines behave as in run_batch. Returns a dict mapping market -> updates.
+    """
+    browser_queues = [asyncio.Queue() for _ in range(browsers)]
+    pinned = {queue: 0 for queue in browser_queues}  # browser queue -> sources in progress on it
+    llm_queue = asyncio.Queue()
+    # Cap the number of sources in progress so early sources finish before
+    # later ones start piling navigation jobs (and tabs) onto the browsers.
+    active = asyncio.Semaphore(browsers + llm_concurrency)
+    executor = ThreadPoolExecutor(max_workers=browsers, thread_name_prefix="browser")
+    workers = [asyncio.create_task(_browser_worker(queue, executor)) for queue in browser_queues]
+    workers += [asyncio.create_task(_llm_worker(llm_queue)) for _ in range(llm_concurrency)]
+
+    async def run_one(source):
+        async with active:
+            if deadline.expired():
+                return source.get("market"), None
+            if on_start:
+                on_start(source)
+            error = None
+            stats = {}
+            browser_queue = min(browser_queues, key=pinned.get)
+            pinned[browser_queue] += 1
+            try:
+                updates = await _crawl_source_async(source, browser_queue, llm_queue, stats,
+                                                    Deadline(source_budget, parent=deadline, name="source_budget"))
+            except Exception as e:
+                logging.error(f"Unhandled error while processing {source.get('market')}: {e}")
+                updates, error = None, str(e)
+            finally:
+                pinned[browser_queue] -= 1
+            if on_result:
+                on_result(source, updates, error, stats)
+            return source.get("market"), updates
+
+    logging.info(f"Starting async pipeline for {len(sources)} sources with "
+                 f"{browsers} browsers and {llm_concurrency} LLM workers.")
+    try:
+        results = dict(await asyncio.gather(*(run_one(source) for source in sources)))
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        executor.shutdown(wait=True)
+    return results
+
+# -------------------------------
+# Process Pool Runner
+# -------------------------------
+# Each worker process owns its own Browser. The parent hands out one source
+# at a time to whichever process is idle (picking, as SourceQueue does, a
+# source whose domain is not saturated), so the sweep's makespan tracks total
+# work instead of the slowest static shard. CPU-heavy work (screenshot
+# encoding, prompt building, JSON parsing) runs on every core, and a wedged
+# or crashed Chrome only loses the source it was working on: the process is
+# replaced and the pool carries on.
+
+def _pool_worker(worker_id: int, task_queue, result_queue, domain_limits: tuple, settings: dict,
+                 fetch_settings: dict, sweep_expires: float = None, source_budget: float = None,
+                 prewarm: int = 0):
+    """Worker process loop. `sweep_expires` is the sweep deadline as a time.time() value."""
+    domain_scheduler.configure(*domain_limits)
+    browser_settings.update(settings)
+    http_settings.update(fetch_settings)
+    configure_browser_launches(browser_settings["launch_concurrency"])
+    browser_pool.prewarm(prewarm)
+    watchdog = Watchdog(browser_settings["watchdog_timeout"]).start() if browser_settings["watchdog_timeout"] else None
+    # Wall-clock, so the time the process took to spawn and start up counts too.
+    deadline = Deadline(None if sweep_expires is None else sweep_expires - time.time(), name="sweep_deadline")
+    while True:
+        source = task_queue.get()
+        if source is None:
+            if watchdog:
+                watchdog.stop()
+            browser_pool.close()
+            return
+        market = source.get("market")
+        result_queue.put((worker_id, "start", market, None))
+        stats = {}
+        try:
+            updates = process_tariff_source(source, stats,
+                                            Deadline(source_budget, parent=deadline, name="source_budget"))
+            result_queue.put((worker_id, "result", market, (updates, None, stats)))
+        except BrowserCrashed as e:
+            logging.error(f"Browser crashed while processing {market}: {e}")
+            result_queue.put((worker_id, "crashed", market, (None, f"browser crashed: {e}", stats)))
+        except Exception as e:
+            logging.error(f"Unhandled error while processing {market}: {e}")
+            result_queue.put((worker_id, "result", market, (None, str(e), stats)))
+
+def run_process_pool(sources: list, processes: int = 4, on_start=None, on_result=None,
+                     deadline: Deadline = NO_DEADLINE, source_budget: float = None, prewarm: int = 0) -> dict:
+    """
+    Crawl sources on a pool of worker processes (one Browser per process) that
+    pull work dynamically, and collect results as they stream in. A source
+    whose process died is reported as None and the process is replaced.
+    `on_start`/`on_result` are called in the parent process, and the deadlines
+    apply, as in run_batch. Each process keeps `prewarm` idle browsers launched
+    ahead of demand. Returns a dict mapping market -> updates.
+    """
+    processes = max(1, min(processes, len(sources)))
+    work = SourceQueue(sources, domain_scheduler.max_concurrency)
+    # Up to max_concurrency sources of a domain can run in different
+    # processes; give each its share of the domain's request rate.
+    share = max(1, domain_scheduler.max_concurrency)
+    domain_limits = (domain_scheduler.max_concurrency, domain_scheduler.rate / share,
+                     max(1, domain_scheduler.burst // share))
+    by_market = {source.get("market"): source for source in sources}
+    ctx = multiprocessing.get_context("spawn")
+    result_queue = ctx.Queue()
+    workers = {}  # worker id -> (process, task queue)
+    assigned = {}  # worker id -> source in progress
+    crashes = {}  # market -> times its browser or worker process died
+    next_id = [0]
+
+    def requeue(source) -> bool:
+        """Give a source whose browser or process died another go, up to MAX_CRASH_REQUEUES times."""
+        market = source.get("market")
+        crashes[market] = crashes.get(market, 0) + 1
+        if crashes[market] > MAX_CRASH_REQUEUES:
+            return False
+        logging.info(f"Re-queueing {market} on a new browser.")
+        work.requeue(source)
+        return True
+
+    def spawn():
+        worker_id = next_id[0]
+        next_id[0] += 1
+        task_queue = ctx.Queue()
+        # Computed per spawn: a replacement started late in the sweep gets only what is left of it.
+        sweep_expires = None if deadline.remaining() == float("inf") else time.time() + deadline.remaining()
+        proc = ctx.Process(target=_pool_worker,
+                           args=(worker_id, task_queue, result_queue, domain_limits, browser_settings,
+                                 http_settings, sweep_expires, source_budget, prewarm),
+                           name=f"crawl-worker-{worker_id}", daemon=True)
+        proc.start()
+        workers[worker_id] = (proc, task_queue)
+
+    for _ in range(processes):
+        spawn()
+    logging.info(f"Started {len(workers)} worker processes for {len(sources)} sources.")
+
+    results = {}
+    while True:
+        if not deadline.expired():
+            for worker_id in [worker_id for worker_id in workers if worker_id not in assigned]:
+                source = work.try_get()
+                if source is None:
+                    break
+                assigned[worker_id] = source
+                workers[worker_id][1].put(source)
+        if not assigned:
+            break
+        try:
+            worker_id, kind, market, payload = result_queue.get(timeout=1)
+        except queue.Empty:
+            for worker_id, (proc, _) in list(workers.items()):
+                if proc.exitcode is None:
+                    continue
+                del workers[worker_id]
+                source = assigned.pop(worker_id, None)
+                logging.error(f"Worker process {worker_id} exited with code {proc.exitcode}"
+                              + (f" while crawling {source.get('market')}." if source else "."))
+                if source:
+                    work.task_done(source)
+                if source and not requeue(source):
+                    results[source.get("market")] = None
+                    if on_result:
+                        on_result(source, None, f"worker process exited with code {proc.exitcode}", {})
+                if len(work):
+                    spawn()
+            continue
+        if kind == "start":
+            if on_start:
+                on_start(by_market[market])
+            continue
+        updates, error, stats = payload
+        source = assigned.pop(worker_id)
+        work.task_done(source)
+        if kind == "crashed" and requeue(source):
+            continue
+        results[market] = updates
+        if on_result:
+            on_result(source, updates, error, stats)
+        logging.info(f"Worker {worker_id} finished {market} ({len(results)}/{len(sources)}).")
+
+    for proc, task_queue in workers.values():
+        task_queue.put(None)
+    for proc, _ in workers.values():
+        proc.join(timeout=10)
+    for source in sources:
+        results.setdefault(source.get("market"), None)
+    return results
+
+# -------------------------------
+# Durable Job Store
+# -------------------------------
+class JobStore:
+    """
+    SQLite-backed record of a sweep. There is one job per unique (normalized)
+    link; each job tracks its state (pending, running, done, failed), the number
+    of attempts, the markets sharing the link and the extracted updates. A
+    restarted sweep skips done jobs and resumes the rest.
+
+    Several worker processes, possibly on different machines sharing the
+    database file, can drain the same store through lease(): a leased job
+    stays `running` only while its owner keeps heartbeating, and is handed
+    to another worker once the lease expires.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lock = Lock()
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                link TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                markets TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                updated_at REAL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                priority REAL NOT NULL DEFAULT 0
+            )
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("lease_owner", "TEXT"), ("lease_expires", "REAL"),
+                             ("priority", "REAL NOT NULL DEFAULT 0")):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        # Jobs left running by a local sweep that died are picked up again;
+        # leased jobs are reclaimed by lease() once their lease expires.
+        resumed = self.conn.execute(
+            "UPDATE jobs SET status = 'pending' WHERE status = 'running' AND lease_owner IS NULL"
+        ).rowcount
+        if resumed:
+            logging.info(f"Resuming {resumed} jobs left running by a previous sweep.")
+
+    def add_groups(self, groups: dict, priorities: dict = None):
+        """
+        Register the groups from group_sources(); existing jobs keep their state.
+        `priorities` optionally maps normalized link -> priority (higher runs first).
+        """
+        priorities = priorities or {}
+        with self.lock:
+            for link, group in groups.items():
+                markets = json.dumps([source.get("market") for source in group])
+                self.conn.execute(
+                    "INSERT INTO jobs (link, source, markets, updated_at, priority) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(link) DO UPDATE SET markets = excluded.markets, priority = excluded.priority",
+                    (link, json.dumps(group[0]), markets, time.time(), priorities.get(link, 0)),
+                )
+
+    def reject(self, source: dict, error: str):
+        """
+        Mark a link that must not be crawled (e.g. failed preflight) as failed
+        with no attempts left. Done jobs and jobs running under a live lease
+        are left alone: a transient preflight failure on a resumed sweep or on
+        another node must not throw away their results.
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'failed', attempts = MAX(attempts, ?), error = ?, updated_at = ?, "
+                "lease_owner = NULL, lease_expires = NULL WHERE link = ? AND status != 'done' "
+                "AND NOT (status = 'running' AND lease_expires >= ?)",
+                (self.max_attempts, error, now, normalize_link(source.get("link")), now),
+            )
+
+    def pending_sources(self) -> list:
+        """Sources still to crawl: pending jobs and failed jobs with attempts left."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT source FROM jobs WHERE status = 'pending' OR (status = 'failed' AND attempts < ?) "
+                "ORDER BY priority DESC, rowid",
+                (self.max_attempts,),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def mark_running(self, source: dict):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE link = ?",
+                (time.time(), normalize_link(source.get("link"))),
+            )
+
+    def lease(self, owner: str, ttl: float):
+        """
+        Atomically claim the next job that is pending, or failed or running
+        under an expired lease with attempts left. Returns its source, or None.
+        An expired lease with no attempts left (e.g. a source that keeps
+        killing its node) marks the job failed instead of re-leasing it.
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'lease expired on the last attempt', "
+                    "updated_at = ?, lease_owner = NULL, lease_expires = NULL "
+                    "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                    (now, now, self.max_attempts),
+                )
+                row = self.conn.execute(
+                    "SELECT link, source FROM jobs WHERE status = 'pending' "
+                    "OR (status IN ('failed', 'running') AND attempts < ? AND "
+                    "(status = 'failed' OR lease_expires < ?)) ORDER BY priority DESC, rowid LIMIT 1",
+                    (self.max_attempts, now),
+                ).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_owner = ?, "
+                    "lease_expires = ?, updated_at = ? WHERE link = ?",
+                    (owner, now + ttl, now, row[0]),
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return json.loads(row[1])
+
+    def heartbeat(self, source: dict, owner: str, ttl: float) -> bool:
+        """Extend a lease held by `owner`. Returns False if the lease was lost."""
+        with self.lock:
+            return self.conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE link = ? AND lease_owner = ? AND status = 'running'",
+                (time.time() + ttl, normalize_link(source.get("link")), owner),
+            ).rowcount > 0
+
+    def has_live_leases(self) -> bool:
+        """True while some job is running under an unexpired lease."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT 1 FROM jobs WHERE status = 'running' AND lease_expires >= ? LIMIT 1", (time.time(),)
+            ).fetchone() is not None
+
+    def record_result(self, source: dict, updates, error: str = None, stats: dict = None, owner: str = None):
+        """
+        Store the outcome of a crawl; None updates mark the job as failed.
+        A crawl cut short by its per-source budget is stored as done with the
+        partial updates and a note on where it stopped; one cut short by the
+        sweep deadline goes back to pending so the next sweep finishes it.
+        With `owner` set, a failure is only recorded while that owner still
+        holds the lease, so it cannot clobber a retry running elsewhere.
+        """
+        stopped = (stats or {}).get("stopped")
+        if stopped:
+            error = f"stopped by {stopped} at {(stats or {}).get('last_url')}"
+        if stopped == "sweep_deadline":
+            status, result = "pending", json.dumps(updates) if updates is not None else None
+        elif updates is None:
+            status, result, error = "failed", None, error or "failed to load URL"
+        else:
+            status, result = "done", json.dumps(updates)
+        query = ("UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ?, "
+                 "lease_owner = NULL, lease_expires = NULL WHERE link = ?")
+        params = [status, result, error, time.time(), normalize_link(source.get("link"))]
+        if owner is not None and status != "done":
+            query += " AND lease_owner = ?"
+            params.append(owner)
+        with self.lock:
+            self.conn.execute(query, params)
+
+    def results(self) -> dict:
+        """Map every market in the store to its updates (None if not done)."""
+        with self.lock:
+            rows = self.conn.execute("SELECT markets, status, result FROM jobs ORDER BY rowid").fetchall()
+        results = {}
+        for markets, status, result in rows:
+            updates = json.loads(result) if status == "done" and result is not None else None
+            for market in json.loads(markets):
+                results[market] = updates
+        return results
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# -------------------------------
+# Preflight
+# -------------------------------
+# Cheap checks run concurrently before any Chrome is launched, so that only
+# live, valid URLs reach the browser pipeline. Each unique link is classified
+# as one of PREFLIGHT_OK, "disabled" (status "0" in the sources file),
+# "invalid" (not an http(s) URL), "unresolvable" (DNS lookup failed),
+# "unreachable" (connection failed or timed out) or "not_found" (404/410).
+PREFLIGHT_OK = "ok"
+
+def preflight_source(source: dict, http: urllib3.PoolManager, timeout: float = 10) -> tuple:
+    """Classify one source. Returns (classification, detail, normalized link)."""
+    if str(source.get("status", "1")).strip() == "0":
+        return "disabled", "status is 0", source.get("link")
+    link = normalize_link(source.get("link"))
+    parts = urlsplit(link)
+    if parts.scheme not in ("http", "https") or not parts.hostname or "." not in parts.hostname:
+        return "invalid", "not an http(s) URL", link
+    try:
+        socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80),
+                           type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        return "unresolvable", str(e), link
+    try:
+        response = http.request("HEAD", link, timeout=timeout, redirect=True, preload_content=False)
+        response.release_conn()
+        if response.status in (405, 501):  # HEAD not supported; fall back to GET without reading the body.
+            response = http.request("GET", link, timeout=timeout, redirect=True, preload_content=False)
+            response.release_conn()
+    except urllib3.exceptions.HTTPError as e:
+        return "unreachable", str(e), link
+    if response.status in (404, 410):
+        return "not_found", f"HTTP {response.status}", link
+    # Anything else (including 403/429 bot walls and 5xx) may still render in Chrome.
+    return PREFLIGHT_OK, f"HTTP {response.status}", link
+
+def make_http_pool(maxsize: int = 10, verify: bool = False) -> urllib3.PoolManager:
+    """
+    Pooled HTTP client for cheap checks and fetches, with the browser's user
+    agent. Certificates are only verified with `verify`: liveness checks skip
+    it, since many official sites have broken certificate chains.
+    """
+    if not verify:
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    return urllib3.PoolManager(
+        num_pools=256,
+        maxsize=maxsize,
+        # No overall total: it would cap redirects too, and http -> https -> /en/ chains are common.
+        retries=urllib3.Retry(total=None, connect=1, read=1, redirect=5, status=0, other=0,
+                              raise_on_status=False),
+        cert_reqs="CERT_REQUIRED" if verify else "CERT_NONE",
+        headers={"User-Agent": USER_AGENT},
+    )
+
+def preflight_sources(sources: list, workers: int = 32, timeout: float = 10, http=None) -> tuple:
+    """
+    Run preflight_source concurrently over a shared connection pool.
+    Returns (live sources with normalized links, [(source, classification, detail)] rejected).
+    """
+    http = http or make_http_pool(maxsize=workers)
+    live, rejected = [], []
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="preflight") as executor:
+        checks = executor.map(lambda source: preflight_source(source, http, timeout), sources)
+        for source, (classification, detail, link) in zip(sources, checks):
+            if classification == PREFLIGHT_OK:
+                live.append(dict(source, link=link))
+            else:
+                logging.warning(f"Preflight: skipping {source.get('market')} ({source.get('link')}): "
+                                f"{classification} ({detail}).")
+                rejected.append((source, classification, detail))
+    logging.info(f"Preflight: {len(live)} of {len(sources)} links are live.")
+    return live, rejected
+
+# -------------------------------
+# Source History and Prioritization
+# -------------------------------
+class SourceHistory:
+    """
+    Per-link crawl history kept across sweeps (SQLite): runs, successes,
+    updates found and crawl cost. Used to put high-yield, cheap sources first
+    and to visit sources that never yield anything less and less often.
+    """
+
+    # Prior pseudo-observations so that unseen sources start out optimistic
+    # and a single lucky or unlucky run does not dominate the estimate.
+    PRIOR_RUNS = 1
+    PRIOR_UPDATES = 1
+    PRIOR_SECONDS = 120
+    PRIOR_LLM_CALLS = 5
+
+    def __init__(self, path: str, min_runs: int = 3, revisit_days: float = 1, max_revisit_days: float = 30):
+        self.min_runs = min_runs
+        self.revisit_days = revisit_days
+        self.max_revisit_days = max_revisit_days
+        self.lock = Lock()
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS history (
+                link TEXT PRIMARY KEY,
+                runs INTEGER NOT NULL DEFAULT 0,
+                successes INTEGER NOT NULL DEFAULT 0,
+                updates_found INTEGER NOT NULL DEFAULT 0,
+                dry_runs INTEGER NOT NULL DEFAULT 0,
+                total_seconds REAL NOT NULL DEFAULT 0,
+                total_llm_calls INTEGER NOT NULL DEFAULT 0,
+                last_run REAL,
+                last_success REAL
+            )
+        """)
+
+    def record(self, source: dict, updates, error: str = None, stats: dict = None):
+        """Add one crawl outcome. `dry_runs` counts consecutive runs without updates."""
+        stats = stats or {}
+        now = time.time()
+        found = len(updates) if updates else 0
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO history (link) VALUES (?) ON CONFLICT(link) DO NOTHING",
+                (normalize_link(source.get("link")),),
+            )
+            self.conn.execute(
+                "UPDATE history SET runs = runs + 1, successes = successes + ?, updates_found = updates_found + ?, "
+                "dry_runs = CASE WHEN ? > 0 THEN 0 ELSE dry_runs + 1 END, "
+                "total_seconds = total_seconds + ?, total_llm_calls = total_llm_calls + ?, last_run = ?, "
+                "last_success = CASE WHEN ? > 0 THEN ? ELSE last_success END WHERE link = ?",
+                (int(updates is not None), found, found, stats.get("elapsed", 0), stats.get("llm_calls", 0),
+                 now, found, now, normalize_link(source.get("link"))),
+            )
+
+    def _rows(self) -> dict:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT link, runs, updates_found, dry_runs, total_seconds, total_llm_calls, last_run FROM history"
+            ).fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    def expected_cost(self, row) -> float:
+        """Expected crawl time in seconds, with the same prior as score()."""
+        runs, total_seconds = (row[0], row[3]) if row else (0, 0)
+        return (total_seconds + self.PRIOR_SECONDS) / (runs + self.PRIOR_RUNS)
+
+    def score(self, row) -> float:
+        """Expected updates per unit of cost (seconds, with each LLM call priced as 10 s)."""
+        runs, updates_found, _, total_seconds, total_llm_calls, _ = row or (0, 0, 0, 0, 0, None)
+        expected_yield = (updates_found + self.PRIOR_UPDATES) / (runs + self.PRIOR_RUNS)
+        expected_cost = (total_seconds + self.PRIOR_SECONDS
+                         + 10 * (total_llm_calls + self.PRIOR_LLM_CALLS)) / (runs + self.PRIOR_RUNS)
+        return expected_yield / expected_cost
+
+    def is_deferred(self, row, now: float) -> bool:
+        """
+        Sources that came up dry `min_runs` times in a row are revisited with an
+        interval that doubles on every further dry run, capped at `max_revisit_days`.
+        """
+        if not row:
+            return False
+        dry_runs, last_run = row[2], row[5]
+        if dry_runs < self.min_runs or last_run is None:
+            return False
+        interval_days = min(self.max_revisit_days, self.revisit_days * 2 ** (dry_runs - self.min_runs))
+        return now - last_run < interval_days * 86400
+
+    def prioritize(self, sources: list, longest_first: bool = False) -> tuple:
+        """
+        Order sources by descending score and split off the deferred ones.
+        With `longest_first`, order by descending expected crawl time instead:
+        when every source will be crawled anyway, starting the long ones first
+        keeps a few slow sources from stretching the end of the sweep.
+        Returns (sources to crawl, deferred sources, {normalized link: priority}).
+        """
+        rows = self._rows()
+        now = time.time()
+        priorities = {}
+        ready, deferred = [], []
+        for source in sources:
+            link = normalize_link(source.get("link"))
+            row = rows.get(link)
+            priorities[link] = self.expected_cost(row) if longest_first else self.score(row)
+            (deferred if self.is_deferred(row, now) else ready).append(source)
+        ready.sort(key=lambda source: priorities[normalize_link(source.get("link"))], reverse=True)
+        return ready, deferred, priorities
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class LeaseHeartbeat:
+    """Background thread that keeps a JobStore lease alive while a source is being crawled."""
+
+    def __init__(self, store: JobStore, source: dict, owner: str, ttl: float):
+        self.store = store
+        self.source = source
+        self.owner = owner
+        self.ttl = ttl
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.ttl / 3):
+            try:
+                if not self.store.heartbeat(self.source, self.owner, self.ttl):
+                    logging.warning(f"Lost lease on {self.source.get('link')}; another worker may retry it.")
+                    return
+            except sqlite3.Error as e:
+                logging.error(f"Heartbeat for {self.source.get('link')} failed: {e}")
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+def run_lease_worker(store: JobStore, owner: str, workers: int = 1, lease_ttl: float = 120,
+                     history=None, deadline: Deadline = NO_DEADLINE, source_budget: float = None) -> int:
+    """
+    Drain a shared JobStore: each worker thread leases a job, heartbeats while
+    process_tariff_source runs, and records the result (and its cost in the
+    optional SourceHistory). Returns when no job is
+    left to lease and no other worker holds a live lease, or once the sweep
+    `deadline` has passed. Returns the number of jobs processed by this node.
+    """
+    processed = [0]
+    count_lock = Lock()
+
+    def worker(index):
+        worker_id = f"{owner}/{index}"
+        while not deadline.expired():
+            error = None
+            stats = {}
+            # Lease only once a session is free: a job leased while waiting on
+            # the limiter would not heartbeat and could expire and be re-leased.
+            with browser_limiter:
+                source = store.lease(worker_id, lease_ttl)
+                if source is not None:
+                    logging.info(f"{worker_id} leased {source.get('market')} ({source.get('link')}).")
+                    with LeaseHeartbeat(store, source, worker_id, lease_ttl):
+                        try:
+                            updates = process_tariff_source(source, stats, Deadline(source_budget, parent=deadline,
+                                                                                    name="source_budget"))
+                        except Exception as e:
+                            logging.error(f"Unhandled error while processing {source.get('market')}: {e}")
+                            updates, error = None, str(e)
+            if source is None:
+                if not store.has_live_leases():
+                    return
+                # Another worker holds a lease that may still expire; check back later.
+                deadline.sleep(lease_ttl / 3)
+                continue
+            store.record_result(source, updates, error, stats, owner=worker_id)
+            if history:
+                history.record(source, updates, error, stats)
+            with count_lock:
+                processed[0] += 1
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lease") as executor:
+        for future in [executor.submit(worker, index) for index in range(workers)]:
+            future.result()
+    return processed[0]
+
+def run_sources(sources: list, args) -> dict:
+    """
+    Crawl each unique link once with the engine selected by `args.mode` and
+    fan the results out to every market sharing that link. With `args.store`
+    set, progress is checkpointed to a JobStore and finished links are skipped.
+    """
+    domain_scheduler.configure(args.domain_concurrency, args.domain_rate, args.domain_burst)
+    browser_pool.tabs_per_browser = args.tabs_per_browser
+    browser_settings.update(ready_max_wait=args.ready_max_wait, ready_settle=args.ready_settle,
+                            click_max_wait=args.click_max_wait, resource_policy=args.resource_policy,
+                            recycle_pages=args.recycle_pages, recycle_uptime=args.recycle_uptime,
+                            recycle_rss_mb=args.recycle_rss_mb, watchdog_timeout=args.watchdog_timeout,
+                            profile_template=args.profile_template, disk_cache_dir=args.disk_cache_dir,
+                            disk_cache_size=args.disk_cache_size * 1024 * 1024)
+    browser_settings.update(launch_concurrency=args.launch_concurrency)
+    configure_browser_launches(args.launch_concurrency)
+    if not browser_settings["chromedriver_path"]:
+        # Prepared before any worker starts, so that threads and worker processes reuse it.
+        try:
+            browser_settings["chromedriver_path"] = prepare_chromedriver()
+        except Exception as e:
+            logging.warning(f"Could not prepare chromedriver up front, leaving it to the first launch: {e}")
+    if args.profile_template:
+        ensure_profile_template(args.profile_template)
+    cheap = {"image_format": args.screenshot_format, "quality": args.screenshot_quality,
+             "scale": args.screenshot_scale}
+    browser_settings["screenshot_tiers"] = [{"capture": cheap, "detail": "low"}]
+    if args.detail_screenshot:
+        browser_settings["screenshot_tiers"].append(
+            {"capture": dict(cheap, quality=max(args.screenshot_quality, 80), scale=1.0), "detail": "high"})
+    if args.mode != "processes":  # Worker processes pre-warm their own pools.
+        browser_pool.prewarm(args.prewarm)
+    http_settings.update(enabled=args.http_tier, timeout=args.http_timeout)
+    # Worker threads are sized for the largest number of sessions the
+    # adaptive controller may allow; the limiters decide how many are active.
+    sessions = args.browsers if args.mode == "async" else args.workers
+    threads = max(sessions, args.max_workers or 2 * sessions) if args.adaptive else sessions
+    browser_limiter.configure(sessions, threads if args.mode != "async" else sessions)
+    llm_limiter.configure(args.llm_concurrency, args.max_llm_concurrency if args.adaptive else None)
+    deadline = Deadline(args.deadline, name="sweep_deadline")
+    limits = {"deadline": deadline, "source_budget": args.source_budget}
+    groups = group_sources(sources)
+    unique = [group[0] for group in groups.values()]
+    logging.info(f"{len(sources)} sources share {len(unique)} unique links.")
+    rejected = []
+    if args.preflight:
+        unique, rejected = preflight_sources(unique, workers=args.preflight_workers, timeout=args.preflight_timeout)
+    history = SourceHistory(args.history) if args.history else None
+    priorities = None
+    if history:
+        unique, deferred, priorities = history.prioritize(unique, longest_first=args.order == "makespan")
+        for source in deferred:
+            logging.info(f"Deferring low-yield source {source.get('market')} ({source.get('link')}).")
+            del groups[normalize_link(source.get("link"))]
+    store = None
+    callbacks = {}
+    controller = AdaptiveController(browser_limiter, llm_limiter, llm_stats).start() if args.adaptive else None
+    # Worker processes run their own watchdog next to their browser.
+    watchdog = Watchdog(args.watchdog_timeout).start() if args.watchdog_timeout and args.mode != "processes" else None
+
+    def record_result(source, updates, error=None, stats=None):
+        if store:
+            store.record_result(source, updates, error, stats)
+        if history:
+            history.record(source, updates, error, stats)
+
+    if args.lease_worker:
+        store = JobStore(args.store, max_attempts=args.max_attempts)
+        try:
+            store.add_groups(groups, priorities)
+            for source, classification, detail in rejected:
+                store.reject(source, f"preflight: {classification} ({detail})")
+            processed = run_lease_worker(store, args.worker_id, workers=threads,
+                                         lease_ttl=args.lease_ttl, history=history, **limits)
+            logging.info(f"{args.worker_id} processed {processed} jobs; the shared queue is drained.")
+            stored = store.results()
+            return {source.get("market"): stored.get(source.get("market")) for source in sources}
+        finally:
+            store.close()
+            if history:
+                history.close()
+            if controller:
+                controller.stop()
+            if watchdog:
+                watchdog.stop()
+            browser_pool.close()
+    if args.store:
+        store = JobStore(args.store, max_attempts=args.max_attempts)
+        store.add_groups(groups, priorities)
+        for source, classification, detail in rejected:
+            store.reject(source, f"preflight: {classification} ({detail})")
+        live = {normalize_link(source.get("link")) for source in unique}
+        unique = [source for source in store.pending_sources() if normalize_link(source.get("link")) in live]
+        logging.info(f"{len(unique)} links left to crawl according to {args.store}.")
+        callbacks["on_start"] = store.mark_running
+    if store or history:
+        callbacks["on_result"] = record_result
+    try:
+        if args.mode == "async":
+            results = asyncio.run(run_async_pipeline(unique, browsers=args.browsers,
+                                                     llm_concurrency=llm_limiter.max_limit,
+                                                     **callbacks, **limits))
+        elif args.mode == "processes":
+            results = run_process_pool(unique, processes=args.processes, prewarm=args.prewarm,
+                                       **callbacks, **limits)
+        else:
+            results = run_batch(unique, workers=threads, **callbacks, **limits)
+        if deadline.expired():
+            logging.warning("Sweep deadline reached; unfinished sources were left for the next sweep.")
+        if store:
+            stored = store.results()
+            return {source.get("market"): stored.get(source.get("market")) for source in sources}
+        results = fan_out_results(groups, results)
+        for source in sources:
+            results.setdefault(source.get("market"), None)
+        return results
+    finally:
+        if store:
+            store.close()
+        if history:
+            history.close()
+        if controller:
+            controller.stop()
+        if watchdog:
+            watchdog.stop()
+        browser_pool.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Crawl official sources for tariff updates using gpt-4o.")
+    parser.add_argument("--sources", default="test_sources.json",
+                        help="JSON file with the list of sources to crawl.")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Number of worker threads (one Browser per thread).")
+    parser.add_argument("--ready-max-wait", type=float, default=5.0,
+                        help="Maximum seconds to wait for a page to settle before reading it.")
+    parser.add_argument("--ready-settle", type=float, default=0.5,
+                        help="Seconds without DOM mutations or network activity after which a page counts as settled.")
+    parser.add_argument("--click-max-wait", type=float, default=3.0,
+                        help="Seconds to wait for a click to change the page before treating it as a no-op.")
+    parser.add_argument("--recycle-pages", type=int, default=200,
+                        help="Replace a pooled browser after this many page loads (0 = never).")
+    parser.add_argument("--recycle-uptime", type=float, default=1800.0,
+                        help="Replace a pooled browser after this many seconds (0 = never).")
+    parser.add_argument("--recycle-rss-mb", type=int, default=1500,
+                        help="Replace a pooled browser whose process tree uses more memory (0 = never).")
+    parser.add_argument("--watchdog-timeout", type=float, default=120.0,
+                        help="Kill and replace a browser whose driver command hangs for this many seconds, "
+                             "re-queueing its source (0 disables the watchdog).")
+    parser.add_argument("--screenshot-format", choices=["jpeg", "webp", "png"], default="jpeg",
+                        help="Image format of the screenshots sent to gpt-4o.")
+    parser.add_argument("--screenshot-quality", type=int, default=60,
+                        help="JPEG/WebP quality (0-100) of the first, cheap screenshot.")
+    parser.add_argument("--screenshot-scale", type=float, default=0.5,
+                        help="Downscale factor of the first, cheap screenshot.")
+    parser.add_argument("--no-detail-screenshot", dest="detail_screenshot", action="store_false",
+                        help="Go straight to the HTML-only prompt when the cheap screenshot is not enough, "
+                             "instead of retrying with a full-size one.")
+    parser.add_argument("--prewarm", type=int,
+                        help="Idle browsers to keep launched ahead of demand (per worker process in "
+                             "processes mode; 0 disables pre-warming). Default: 1, or 0 in processes mode, "
+                             "where a worker reuses its one browser and a spare would double its Chromes.")
+    parser.add_argument("--launch-concurrency", type=int, default=4,
+                        help="Chrome instances allowed to start at the same time.")
+    parser.add_argument("--profile-template",
+                        help="Chrome profile directory copied into every new browser (created on first use).")
+    parser.add_argument("--disk-cache-dir",
+                        help="Directory holding a shared HTTP cache that new browsers start from and "
+                             "quitting browsers refresh, so repeat visits are served from cache across sweeps.")
+    parser.add_argument("--disk-cache-size", type=int, default=256,
+                        help="Disk cache size per browser in MB.")
+    parser.add_argument("--no-http-tier", dest="http_tier", action="store_false",
+                        help="Always crawl in Chrome instead of trying plain HTTP fetches first.")
+    parser.add_argument("--http-timeout", type=float, default=15.0,
+                        help="Timeout in seconds for each plain HTTP fetch.")
+    parser.add_argument("--block-resources", default="",
+                        help="Comma-separated resource types to block via DevTools: "
+                             + ", ".join(RESOURCE_TYPE_PATTERNS) + ".")
+    parser.add_argument("--block-url", action="append", default=[],
+                        help="Extra URL pattern to block, with * wildcards (may be repeated).")
+    parser.add_argument("--resource-allow", action="append", default=[], metavar="DOMAIN=ITEM[,ITEM]",
+                        help="Resource types or URL patterns to allow on a registered domain despite "
+                             "the block list (may be repeated).")
+    parser.add_argument("--tabs-per-browser", type=int, default=1,
+                        help="Serve up to this many sources concurrently from one Chrome, one tab each.")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Grow and shrink browser sessions and in-flight LLM requests at runtime (AIMD) "
+                             "based on free memory, CPU load, Chrome RSS and gpt-4o latency/errors.")
+    parser.add_argument("--max-workers", type=int,
+                        help="Upper bound on browser sessions with --adaptive (default: twice --workers).")
+    parser.add_argument("--max-llm-concurrency", type=int, default=64,
+                        help="Upper bound on in-flight LLM requests with --adaptive.")
+    parser.add_argument("--mode", choices=["threads", "async", "processes"], default="threads",
+                        help="Execution engine: thread pool, asyncio pipeline overlapping browser and LLM work, "
+                             "or a pool of worker processes.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help="Number of worker processes in processes mode (one Browser per process).")
+    parser.add_argument("--browsers", type=int, default=2,
+                        help="Number of Chrome instances in async mode.")
+    parser.add_argument("--llm-concurrency", type=int, default=16,
+                        help="Maximum gpt-4o requests in flight (the starting value with --adaptive).")
+    parser.add_argument("--domain-concurrency", type=int, default=2,
+                        help="Maximum concurrent requests (and sources in progress) per registered domain.")
+    parser.add_argument("--domain-rate", type=float, default=0.5,
+                        help="Sustained navigation/click rate per registered domain, in requests per second.")
+    parser.add_argument("--domain-burst", type=int, default=2,
+                        help="Requests per registered domain allowed in a burst before rate limiting applies.")
+    parser.add_argument("--deadline", type=float,
+                        help="Global sweep deadline in seconds; no source is started after it and running "
+                             "crawls stop early, keeping their partial results.")
+    parser.add_argument("--source-budget", type=float, default=600,
+                        help="Wall-clock budget per source in seconds.")
+    parser.add_argument("--no-preflight", dest="preflight", action="store_false",
+                        help="Skip the DNS/HTTP preflight and send every source to the browser.")
+    parser.add_argument("--preflight-workers", type=int, default=32,
+                        help="Concurrent preflight checks.")
+    parser.add_argument("--preflight-timeout", type=float, default=10,
+                        help="Timeout in seconds for each preflight HTTP request.")
+    parser.add_argument("--store",
+                        help="SQLite file used to checkpoint the sweep; re-running with the same file resumes it.")
+    parser.add_argument("--max-attempts", type=int, default=3,
+                        help="Maximum attempts per link before a failed job is no longer retried (with --store).")
+    parser.add_argument("--history",
+                        help="SQLite file with per-source crawl history, kept across sweeps. Used to crawl "
+                             "high-yield, cheap sources first and defer sources that never yield updates.")
+    parser.add_argument("--order", choices=["score", "makespan"], default="score",
+                        help="Crawl order with --history: 'score' starts the sources most likely to yield "
+                             "updates first; 'makespan' starts the slowest first, which shortens a sweep "
+                             "that crawls every source anyway (no --deadline).")
+    parser.add_argument("--lease-worker", action="store_true",
+                        help="Join a shared --store as a worker node: lease jobs, heartbeat while crawling, "
+                             "and exit once the queue is drained. Run on several machines against one file.")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}",
+                        help="Identifier of this node in lease mode.")
+    parser.add_argument("--lease-ttl", type=float, default=120,
+                        help="Seconds a lease stays valid without a heartbeat before the job is re-queued.")
+    parser.add_argument("--market", action="append",
+                        help="Only crawl the given market (may be repeated).")
+    args = parser.parse_args(argv)
+    if args.lease_worker and not args.store:
+        parser.error("--lease-worker requires --store")
+    if args.prewarm is None:
+        args.prewarm = 0 if args.mode == "processes" else 1
+    args.resource_policy = None
+    block_types = [kind.strip() for kind in args.block_resources.split(",") if kind.strip()]
+    if block_types or args.block_url:
+        allow = {}
+        for entry in args.resource_allow:
+            domain, _, items = entry.partition("=")
+            allow.setdefault(domain.strip(), []).extend(item.strip() for item in items.split(",") if item.strip())
+        try:
+            args.resource_policy = ResourcePolicy(block_types, args.block_url, allow)
+        except ValueError as e:
+            parser.error(str(e))
+    return args
 
 # -------------------------------
 # Main Entry Point
 # -------------------------------
 if __name__ == "__main__":
-    # Define your test tariff source: Turkmenistan Customs news page.
-    test_source = {
-        "market": "Turkmenistan - TM",
-        "link": "https://customs.gov.tm/news/customs"
-    }
-    process_tariff_source(test_source)
+    args = parse_args()
+    sources = load_sources(args.sources)
+    if args.market:
+        sources = [s for s in sources if s.get("market") in args.market]
+    results = run_sources(sources, args)
+    print(json.dumps(results, indent=4))
@@ -0,0 +1,38 @@
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+import main  # noqa: E402
+
+
+def make_controller(monkeypatch, free=0.5, browsers_held=0, llm_held=0):
+    monkeypatch.setattr(main, "system_memory", lambda: (free * 100, 100))
+    monkeypatch.setattr(main, "system_cpu_load", lambda: 0.1)
+    browsers, llm = main.AdaptiveLimiter(8), main.AdaptiveLimiter(16)
+    for _ in range(browsers_held):
+        browsers.acquire()
+    for _ in range(llm_held):
+        llm.acquire()
+    return main.AdaptiveController(browsers, llm, main.LLMStats())
+
+
+def test_memory_pressure_waits_for_the_last_cut(monkeypatch):
+    controller = make_controller(monkeypatch, free=0.05, browsers_held=8)
+    for _ in range(3):
+        controller.adjust()
+    assert controller.browsers.limit == 4
+    for _ in range(4):
+        controller.browsers.release()
+    controller.adjust()
+    assert controller.browsers.limit == 2
+
+
+def test_llm_errors_are_acted_on_once(monkeypatch):
+    controller = make_controller(monkeypatch, llm_held=4)
+    for _ in range(50):
+        controller.stats.observe(1.0, True)
+    controller.adjust()
+    controller.adjust()
+    assert controller.llm.limit == 8
+    controller.stats.observe(1.0, False)
+    controller.adjust()
+    assert controller.llm.limit == 8
@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+import main  # noqa: E402
+
+
+@pytest.mark.parametrize("url, domain", [
+    ("https://www.customs.go.jp/english/tariff/index.htm", "customs.go.jp"),
+    ("https://www.customs.go.th/", "customs.go.th"),
+    ("https://english.moef.go.kr/ec/selectTbEconomicDtl.do", "moef.go.kr"),
+    ("https://www.ura.go.ug/", "ura.go.ug"),
+    ("https://www.bmf.gv.at/", "bmf.gv.at"),
+    ("https://www.army.mil.ng/", "army.mil.ng"),
+    ("https://customs.gov.dm/", "customs.gov.dm"),
+    ("https://www.zimra.co.zw/", "zimra.co.zw"),
+    ("https://portal.sat.gob.gt/", "sat.gob.gt"),
+    ("https://www.customs.govt.nz/", "customs.govt.nz"),
+    ("https://taxation-customs.ec.europa.eu/", "europa.eu"),
+    ("https://www.zoll.de/", "zoll.de"),
+    ("https://www.mra.mu/", "mra.mu"),
+    ("http://10.0.0.1:8080/", "10.0.0.1"),
+    ("not a url", ""),
+])
+def test_registered_domain(url, domain):
+    assert main.registered_domain(url) == domain
+
+
+def test_government_sites_get_separate_buckets():
+    assert main.registered_domain("https://www.customs.go.jp/") != main.registered_domain("https://www.mof.go.jp/")
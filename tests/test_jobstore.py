@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+import main  # noqa: E402
+
+A = {"market": "A", "link": "https://a.example/"}
+B = {"market": "B", "link": "https://b.example/"}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = main.JobStore(str(tmp_path / "jobs.db"), max_attempts=2)
+    store.add_groups(main.group_sources([A, B]))
+    yield store
+    store.close()
+
+
+def test_reject_marks_pending_job_failed(store):
+    store.reject(A, "preflight: unresolvable")
+    assert store.results()["A"] is None
+    assert store.pending_sources() == [B]
+
+
+def test_reject_keeps_done_job(store):
+    store.record_result(A, [{"title": "new tariff"}])
+    store.reject(A, "preflight: unreachable")
+    assert store.results()["A"] == [{"title": "new tariff"}]
+
+
+def test_reject_keeps_job_under_live_lease(store):
+    leased = store.lease("node-1", ttl=60)
+    store.reject(leased, "preflight: unreachable")
+    assert store.heartbeat(leased, "node-1", ttl=60)
+    store.record_result(leased, [], owner="node-1")
+    assert store.results()[leased["market"]] == []
+
+
+def expire_leases(store):
+    store.conn.execute("UPDATE jobs SET lease_expires = 0 WHERE status = 'running'")
+
+
+def test_lease_hands_out_each_job_once(store):
+    first = store.lease("node-1", ttl=60)
+    second = store.lease("node-2", ttl=60)
+    assert {first["market"], second["market"]} == {"A", "B"}
+    assert store.lease("node-3", ttl=60) is None
+    assert store.has_live_leases()
+
+
+def test_lease_follows_priority(tmp_path):
+    store = main.JobStore(str(tmp_path / "jobs.db"))
+    groups = main.group_sources([A, B])
+    store.add_groups(groups, {main.normalize_link(B["link"]): 5})
+    assert store.lease("node-1", ttl=60) == B
+    store.close()
+
+
+def test_heartbeat_only_extends_own_lease(store):
+    leased = store.lease("node-1", ttl=60)
+    assert store.heartbeat(leased, "node-1", ttl=60)
+    assert not store.heartbeat(leased, "node-2", ttl=60)
+
+
+def test_expired_lease_is_reclaimed(store):
+    store.lease("node-1", ttl=60)
+    store.lease("node-1", ttl=60)
+    expire_leases(store)
+    assert not store.has_live_leases()
+    reclaimed = store.lease("node-2", ttl=60)
+    assert reclaimed in (A, B)
+    # The first owner lost its lease: no heartbeat, and its failure is not recorded.
+    assert not store.heartbeat(reclaimed, "node-1", ttl=60)
+    store.record_result(reclaimed, None, "crashed", owner="node-1")
+    store.record_result(reclaimed, [], owner="node-2")
+    assert store.results()[reclaimed["market"]] == []
+
+
+def test_reclaim_stops_after_max_attempts(store):
+    store.reject(B, "preflight: unresolvable")
+    for _ in range(2):
+        assert store.lease("node-1", ttl=60) == A
+        expire_leases(store)
+    assert store.lease("node-2", ttl=60) is None
+    status, attempts = store.conn.execute(
+        "SELECT status, attempts FROM jobs WHERE link = ?", (main.normalize_link(A["link"]),)
+    ).fetchone()
+    assert (status, attempts) == ("failed", 2)
+    assert not store.has_live_leases()
@@ -0,0 +1,91 @@
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+import main  # noqa: E402
+
+REDIRECTS = {"/a": (301, "/b"), "/b": (302, "/c")}
+PAGES = {"/c": 200, "/": 200, "/gone": 410}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def _respond(self, body):
+        if self.path in REDIRECTS:
+            status, location = REDIRECTS[self.path]
+            self.send_response(status)
+            self.send_header("Location", location)
+            self.end_headers()
+            return
+        self.send_response(PAGES.get(self.path, 404))
+        self.send_header("Content-Type", "text/html")
+        self.end_headers()
+        if body:
+            self.wfile.write(b"<html>ok</html>")
+
+    def do_HEAD(self):
+        self._respond(body=False)
+
+    def do_GET(self):
+        self._respond(body=True)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def site():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def classify(link, **fields):
+    source = dict({"market": "test", "link": link}, **fields)
+    return main.preflight_source(source, main.make_http_pool(), timeout=5)[0]
+
+
+def test_live_page(site):
+    assert classify(site + "/") == main.PREFLIGHT_OK
+
+
+def test_redirect_chain(site):
+    assert classify(site + "/a") == main.PREFLIGHT_OK
+
+
+@pytest.mark.parametrize("path", ["/missing", "/gone"])
+def test_not_found(site, path):
+    assert classify(site + path) == "not_found"
+
+
+def test_disabled(site):
+    assert classify(site + "/", status="0") == "disabled"
+
+
+def test_invalid():
+    assert classify("Ministry of Industry and Trade website (no direct link)") == "invalid"
+
+
+def test_unresolvable():
+    assert classify("http://no-such-host.invalid/") == "unresolvable"
+
+
+def test_unreachable():
+    assert classify(f"http://127.0.0.1:{closed_port()}/") == "unreachable"
+
+
+def test_preflight_sources_splits_live_and_rejected(site):
+    sources = [{"market": "up", "link": site + "/a"}, {"market": "down", "link": site + "/missing"}]
+    live, rejected = main.preflight_sources(sources, workers=2, timeout=5)
+    assert [source["market"] for source in live] == ["up"]
+    assert [(source["market"], classification) for source, classification, _ in rejected] == [("down", "not_found")]